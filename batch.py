@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+""" many deals of sapphire.py at once with numpy
+
+    A batch of n deals is an n x 52 array of card locations plus the
+    shuffles, discards, knock values and draw counts of each deal. All the
+    deals advance a turn together (sapphire moves on even turns) following
+    the rules of sapphire.deal(). Hands are scored with the same method as
+    deadwood.py: try every choice of sets, then look the rest of each suit
+    up in the tables of tables.py. The discard is taken by the rule of
+    should_take_discard (it lets more cards be melded), the throw is the
+    nearest rule to choose_throw that vectorizes: the card that leaves the
+    least deadwood, highest rank on ties. """
+
+from itertools import product
+import numpy as np
+import tables
+
+PILE, HAND, OPP, DISCARD = 0, 1, 2, 3
+
+RUN_DEADWOOD = np.array([pts for pts, runs in tables.BEST])
+RUN_COVER = np.array(tables.COVER)
+WEIGHTS = 1 << np.arange(13)
+
+def set_choices(grid):
+    """ generate (games, rest, melded) for every choice of sets of an
+        n x 4 x 13 bool array of hands of at most 11 cards: the indices of
+        the hands the choice is open to, their suit patterns without the
+        sets and the number of cards in sets. No sets is open to every
+        hand and comes first. The other choices are only tried for the
+        hands holding 3 or 4 of a rank, grouped by the sizes of their (at
+        most 3) such ranks, so each group goes through its own choices:
+        0 no set, 1 all the cards of the rank, 2 + s all but suit s """
+    n = len(grid)
+    patterns = (grid * WEIGHTS).sum(axis = 2)
+    yield np.arange(n), patterns, 0
+    counts = grid.sum(axis = 1)
+    ranks = np.argsort(-counts, axis = 1, kind = 'mergesort')[:, :3]
+    sizes = counts[np.arange(n)[:, None], ranks]
+    options = np.where(sizes == 4, 6, np.where(sizes == 3, 2, 1))
+    kinds = (options * [49, 7, 1]).sum(axis = 1)
+    for kind in np.unique(kinds[options[:, 0] > 1]):
+        games = np.nonzero(kinds == kind)[0]
+        m = len(games)
+        have = grid[games].transpose(0, 2, 1)[np.arange(m)[:, None], ranks[games]]
+        bits = 1 << ranks[games]
+        for choice in product(*[range(o) for o in options[games[0]]]):
+            if not any(choice):
+                continue
+            removed = np.zeros((m, 4), int)
+            melded = 0
+            for k, option in enumerate(choice):
+                if option == 0:
+                    continue
+                take = have[:, k]
+                if option > 1:
+                    take = take.copy()
+                    take[:, option - 2] = False
+                removed |= take * bits[:, k:k + 1]
+                melded += take[0].sum()
+            yield games, patterns[games] & ~removed, melded
+
+def evaluate(hands):
+    """ (least deadwood, most melded cards) of an n x 52 bool array of
+        hands of at most 11 cards """
+    n = len(hands)
+    best_dw = np.empty(n, int)
+    best_dw.fill(1000)
+    best_melded = np.zeros(n, int)
+    for games, rest, melded in set_choices(hands.reshape(n, 4, 13)):
+        dw = RUN_DEADWOOD[rest].sum(axis = 1)
+        melded = melded + RUN_COVER[rest].sum(axis = 1)
+        best_dw[games] = np.minimum(best_dw[games], dw)
+        best_melded[games] = np.maximum(best_melded[games], melded)
+    return best_dw, best_melded
+
+def choose_throws(hands):
+    """ (card, deadwood after) for an n x 52 array of 11 card hands. As in
+        HandState.each_removed, a choice of sets is looked at once for
+        all 11 throws, only the suit of the thrown card changes """
+    n = len(hands)
+    rows = np.arange(n)
+    cards = np.argsort(~hands, axis = 1, kind = 'mergesort')[:, :11]
+    after = np.empty((n, 11), int)
+    after.fill(1000)
+    for games, rest, melded in set_choices(hands.reshape(n, 4, 13)):
+        r = np.arange(len(games))[:, None]
+        suit_dw = RUN_DEADWOOD[rest]
+        c = cards[games]
+        row, col = c // 13, c % 13
+        pattern = rest[r, row]
+        dw = (suit_dw.sum(axis = 1)[:, None] - suit_dw[r, row]
+              + RUN_DEADWOOD[pattern & ~(1 << col)])
+        # a card in one of the chosen sets cannot be thrown from it
+        held = (pattern >> col) & 1 == 1
+        after[games] = np.where(held, np.minimum(after[games], dw), after[games])
+    pick = (after * 16 - cards % 13).argmin(axis = 1)
+    return cards[rows, pick], after[rows, pick]
+
+class Batch(object):
+    """ n deals played in step """
+    def __init__(self, n, seed = None):
+        self.n = n
+        self.rng = np.random.RandomState(seed)
+        self.order = self.rng.rand(n, 52).argsort(axis = 1)
+        self.loc = np.zeros((n, 52), np.int8)
+        rows = np.arange(n)
+        self.loc[rows[:, None], self.order[:, :10]] = HAND
+        self.loc[rows[:, None], self.order[:, 10:20]] = OPP
+        self.top = self.order[:, 20].copy()
+        self.loc[rows, self.top] = DISCARD
+        col = self.top % 13
+        self.knock = np.where(col == 0, 0, np.minimum(col + 1, 10))
+        self.drawn = np.zeros(n, int)
+        self.turns = np.zeros(n, int)
+        self.active = np.ones(n, bool)
+        self.sapphire_wins = np.zeros(n, bool)
+        self.score = np.zeros(n, int)
+        self.turn = 0
+
+    def finish(self, games, player):
+        """ games end with a knock by player """
+        other = OPP if player == HAND else HAND
+        counted = 31 - self.drawn[games] > 2
+        score = evaluate(self.loc[games] == other)[0]
+        self.sapphire_wins[games] = counted & (player == HAND)
+        self.score[games] = np.where(counted, score, 0)
+        self.active[games] = False
+
+    def step(self):
+        """ play one turn of every unfinished deal, False when all are done """
+        games = np.nonzero(self.active)[0]
+        if not len(games):
+            return False
+        player = HAND if self.turn % 2 == 0 else OPP
+        self.turn += 1
+        self.turns[games] += 1
+        hands = self.loc[games] == player
+        dw, melded = evaluate(hands)
+        knocks = dw <= self.knock[games]
+        self.finish(games[knocks], player)
+
+        games = games[~knocks]
+        hands = hands[~knocks]
+        rows = np.arange(len(games))
+        top = self.top[games]
+        with_top = hands.copy()
+        with_top[rows, top] = True
+        take = evaluate(with_top)[1] > melded[~knocks]
+        pick = self.order[games, 21 + self.drawn[games]]
+        card = np.where(take, top, pick)
+        self.drawn[games] += ~take
+        self.loc[games, card] = player
+        hands[rows, card] = True
+
+        throw, after = choose_throws(hands)
+        self.loc[games, throw] = DISCARD
+        self.top[games] = throw
+        gin = after <= self.knock[games]
+        self.finish(games[gin], player)
+
+        # deals out of cards or turns score nothing
+        games = games[~gin]
+        over = (31 - self.drawn[games] <= 2) | (self.turns[games] >= 50)
+        self.active[games[over]] = False
+        return True
+
+    def run(self):
+        while self.step():
+            pass
+        return self
+
+    def stats(self):
+        """ fraction of deals won by each player, drawn, and mean scores """
+        s_won = self.sapphire_wins
+        o_won = ~s_won & (self.score > 0)
+        return {'sapphire': s_won.mean(), 'opponent': o_won.mean(),
+                'nothing': (~s_won & ~o_won).mean(),
+                'sapphire_score': self.score[s_won].mean() if s_won.any() else 0.0,
+                'opponent_score': self.score[o_won].mean() if o_won.any() else 0.0,
+                'turns': self.turns.mean()}
+
+def scalar_stats(deals):
+    """ the same statistics from sapphire.deal() """
+    import sapphire
+    deck = sapphire.Deck()
+    results = [sapphire.deal(deck) for i in range(deals)]
+    s_scores = [s for win, s in results if win]
+    o_scores = [s for win, s in results if not win and s]
+    n = float(deals)
+    return {'sapphire': len(s_scores) / n, 'opponent': len(o_scores) / n,
+            'nothing': (deals - len(s_scores) - len(o_scores)) / n,
+            'sapphire_score': sum(s_scores) / float(len(s_scores) or 1),
+            'opponent_score': sum(o_scores) / float(len(o_scores) or 1)}
+
+def compare(deals = 1000, seed = 0):
+    """ print the batch statistics next to those of the scalar loop """
+    import random
+    random.seed(seed)
+    b = Batch(deals, seed).run().stats()
+    s = scalar_stats(deals)
+    for key in sorted(s):
+        print '%15s  batch: %7.3f  scalar: %7.3f' % (key, b[key], s[key])
+
+if __name__ == "__main__":
+    compare()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+""" benchmarks of the hot paths of sapphire.py
+
+    Every case is timed call by call over a fixed, seeded corpus, so runs
+    on the same machine are comparable. 'dense' corpora draw hands from
+    five neighbouring ranks of all four suits, the hands with the most
+    overlapping runs and sets.
+
+    python bench.py [-o results.json] [-b baseline.json] [-t 1.25]
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from timeit import default_timer as timer
+import sapphire
+from sapphire import Deck
+
+DENSE = [row * 13 + col for row in range(4) for col in range(3, 8)]
+
+def hands(count, size, seed, dense = False):
+    """ count decks with a hand of size cards in 'h', ten cards in 'u', a
+        card in 'd' and the rest in 'p' """
+    rng = random.Random(seed)
+    decks = []
+    for i in range(count):
+        deck = Deck(rng)
+        deck.shuffle()
+        pool = DENSE if dense else range(52)
+        hand = rng.sample(pool, size)
+        rest = [idx for idx in range(52) if idx not in hand]
+        rng.shuffle(rest)
+        for idx in hand:
+            deck.move(deck.cards[idx], 'h')
+        for idx in rest[:10]:
+            deck.move(deck.cards[idx], 'u')
+        deck.move(deck.cards[rest[10]], 'd')
+        decks.append(deck)
+    return decks
+
+def dealt(count, seed):
+    """ count decks at the start of a deal with their up card and knock
+        value """
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        deck = Deck(rng)
+        discard, knock_value = sapphire.start_deal(deck)
+        result.append((deck, discard, knock_value))
+    return result
+
+def time_calls(calls):
+    """ seconds taken by each call in calls """
+    times = []
+    for call in calls:
+        start = timer()
+        call()
+        times.append(timer() - start)
+    return times
+
+def discard_of(deck):
+    return sapphire.get_location(deck, 'd')[0]
+
+def cases(size, seed):
+    """ generate (name, calls) for every benchmark """
+    n = size
+    for kind, dense in (('random', False), ('dense', True)):
+        decks = hands(n, 11, seed, dense)
+        yield 'possibilities/' + kind, [
+            (lambda d: lambda: sapphire.possibilities(d, 'h'))(d) for d in decks]
+        yield 'ranked_hands/top3/' + kind, [
+            (lambda d: lambda: list(sapphire.ranked_hands(d, 'h', 3)))(d) for d in decks]
+        yield 'ranked_hands/all/' + kind, [
+            (lambda d: lambda: list(sapphire.ranked_hands(d, 'h')))(d) for d in decks]
+        yield 'best_hand/' + kind, [
+            (lambda d: lambda: sapphire.best_hand(d, 'h'))(d) for d in decks]
+        yield 'evaluate_discards/' + kind, [
+            (lambda d: lambda: sapphire.evaluate_discards(d, 'h'))(d) for d in decks]
+        yield 'wildness/' + kind, [
+            (lambda d, c: lambda: sapphire.wildness(d, c))(d, c)
+            for d in decks for c in sapphire.get_location(d, 'h')]
+        decks = hands(n, 10, seed + 1, dense)
+        yield 'should_take_discard/' + kind, [
+            (lambda d: lambda: sapphire.should_take_discard(d, 'h', discard_of(d)))(d)
+            for d in decks]
+    starts = dealt(n, seed + 2)
+    yield 'take_turn', [
+        (lambda d, c, k: lambda: sapphire.take_turn(d, 'h', c, k))(d, c, k)
+        for d, c, k in starts]
+    rng = random.Random(seed + 3)
+    deck = Deck(rng)
+    yield 'deal', [lambda: sapphire.deal(deck) for i in range(max(n // 10, 1))]
+
+def summary(times):
+    times = sorted(times)
+    n = len(times)
+    total = sum(times)
+    def pct(q):
+        return times[min(int(q * n), n - 1)] * 1e6
+    return {'calls': n, 'ops_per_sec': n / total if total else 0.0,
+            'mean_us': total / n * 1e6, 'p50_us': pct(0.5),
+            'p90_us': pct(0.9), 'p99_us': pct(0.99), 'max_us': times[-1] * 1e6}
+
+def run(size = 500, seed = 0, only = None):
+    results = {}
+    for name, calls in cases(size, seed):
+        if only and not any([name.startswith(o) for o in only]):
+            continue
+        results[name] = summary(time_calls(calls))
+        report(name, results[name])
+    return {'meta': {'size': size, 'seed': seed, 'python': platform.python_version(),
+                     'machine': platform.machine(), 'time': time.time()},
+            'results': results}
+
+def report(name, r):
+    print '%-28s %10.0f ops/s  p50 %9.1f  p90 %9.1f  p99 %9.1f us' % (
+        name, r['ops_per_sec'], r['p50_us'], r['p90_us'], r['p99_us'])
+
+def compare(results, baseline, threshold = 1.25):
+    """ names of the cases whose median is threshold times the baseline's
+        or more """
+    slower = []
+    for name, r in sorted(results['results'].items()):
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        ratio = r['p50_us'] / old['p50_us'] if old['p50_us'] else 1.0
+        flag = ' REGRESSION' if ratio >= threshold else ''
+        print '%-28s %6.2fx baseline%s' % (name, ratio, flag)
+        if flag:
+            slower.append(name)
+    return slower
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'benchmark the gin engine')
+    parser.add_argument('-n', '--size', type = int, default = 500, help = 'hands per corpus')
+    parser.add_argument('-s', '--seed', type = int, default = 0)
+    parser.add_argument('-o', '--output', default = 'bench.json', help = 'results file')
+    parser.add_argument('-b', '--baseline', help = 'results file to compare with')
+    parser.add_argument('-t', '--threshold', type = float, default = 1.25,
+                        help = 'slowdown of the median counted as a regression')
+    parser.add_argument('cases', nargs = '*', help = 'only cases starting with these names')
+    args = parser.parse_args(argv)
+    results = run(args.size, args.seed, args.cases)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent = 2, sort_keys = True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+""" hands up to a renaming of the suits
+
+    Gin does not care which suit is which, so the 24 ways of renaming the
+    suits of a hand give hands with the same melds and deadwood. A hand's
+    canonical form has its suits sorted by rank pattern, highest first,
+    and comes with the permutation that maps results for it back to the
+    hand.
+
+        key, perm = canonical(hand)
+        melds = [permute(m, perm) for m in melds_of(key)] """
+
+from masks import *
+
+def canonical(hand):
+    """ (key, perm): hand with its suits sorted by rank pattern, highest
+        first, where suit i of key is suit perm[i] of hand """
+    fields = [suit_ranks(hand, row) for row in range(4)]
+    perm = sorted(range(4), key = lambda row: fields[row], reverse = True)
+    key = 0
+    for i, row in enumerate(perm):
+        key |= fields[row] << (13 * i)
+    return key, perm
+
+def permute(mask, perm):
+    """ map a mask in the suits of a canonical key back to the hand """
+    result = 0
+    for i, row in enumerate(perm):
+        result |= suit_ranks(mask, i) << (13 * row)
+    return result
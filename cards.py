@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+""" the 52 cards
+
+    Cards are immutable and there is exactly one of each: CARDS[index],
+    where index = row * 13 + col as in masks.py. Everything that changes
+    during a game (where a card is, its position in the shuffle) is kept
+    by the deck of that game in arrays indexed by card.index, so decks
+    share the cards, a new deal allocates nothing per card and
+    arrangements of cards from any deck compare equal. """
+
+from masks import SUITS, RANKS, bit
+
+class Card(object):
+    """ a playing card: rank and suit as letters, row (suit) and col
+        (rank) of the grid, index, its 52 bit mask and its points """
+    __slots__ = ('rank', 'suit', 'row', 'col', 'index', 'bit', 'points')
+
+    def __init__(self, row, col):
+        init = object.__setattr__
+        init(self, 'rank', RANKS[col])
+        init(self, 'suit', SUITS[row])
+        init(self, 'row', row)
+        init(self, 'col', col)
+        init(self, 'index', row * 13 + col)
+        init(self, 'bit', bit(row, col))
+        init(self, 'points', min(col + 1, 10))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('cards are immutable, locations are kept by the deck')
+
+    def __repr__(self):
+        return '%s%s' % (self.rank, self.suit)
+
+    def __reduce__(self):
+        """ unpickle to the same card """
+        return card, (self.index,)
+
+CARDS = tuple([Card(row, col) for row in range(4) for col in range(13)])
+GRID = tuple([CARDS[row * 13:(row + 1) * 13] for row in range(4)])
+BY_NAME = dict([(repr(c), c) for c in CARDS])
+
+def card(index):
+    """ the card with index row * 13 + col """
+    return CARDS[index]
+
+def parse(name):
+    """ the card named by rank and suit letters such as 'TD' or 'as' """
+    return BY_NAME[name.upper()]
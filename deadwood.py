@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+""" minimum deadwood solver over 52 bit hand masks (see masks.py)
+
+    A card is in a set, in a run or it is deadwood. Sets are chosen first,
+    for each rank with 3 or 4 cards either no set, the set of 4 or one of
+    the sets of 3. What is left splits into the four suits, and the best
+    runs of a suit only depend on its 13 bit rank pattern, so those are
+    looked up in tables.BEST. """
+
+import heapq
+from itertools import product
+from masks import *
+from tables import BEST, POINTS, RUN_MASKS
+
+def mask_points(mask):
+    """ points of the cards in mask """
+    return sum([POINTS[i % 13] for i in iter_bits(mask)])
+
+def melded(groups):
+    """ number of cards in the melds of an arrangement, at most 4 a meld """
+    return sum([min(popcount(m), 4) for m in groups if popcount(m) >= 3])
+
+def unmelded(groups):
+    """ deadwood points of an arrangement """
+    return sum([mask_points(m) for m in groups if popcount(m) < 3])
+
+def suit_runs(ranks):
+    """ (deadwood, runs) for the best split of a 13 bit rank pattern into
+        runs of 3 or more, runs are (start, length) pairs """
+    return BEST[ranks]
+
+def set_choices(hand):
+    """ for each rank with 3 or more cards the possible sets: none, all of
+        them, or (for 4 of a kind) each set of 3 """
+    choices = []
+    for column in RANK_COLUMN:
+        cards = hand & column
+        if popcount(cards) >= 3:
+            options = [0, cards]
+            if popcount(cards) == 4:
+                options += [cards & ~(1 << i) for i in iter_bits(cards)]
+            choices.append(options)
+    return choices
+
+def best_deadwood(hand):
+    """ (points, melds) for the arrangement of hand with the least deadwood,
+        melds is a list of 52 bit masks, sets first then runs by suit """
+    best = None
+    for chosen in product(*set_choices(hand)):
+        rest = hand
+        for s in chosen:
+            rest &= ~s
+        pts = 0
+        runs = []
+        for row in range(4):
+            p, rs = BEST[suit_ranks(rest, row)]
+            pts += p
+            runs += [run_mask(row, col, n) for col, n in rs]
+        if best is None or pts < best[0]:
+            best = (pts, [s for s in chosen if s] + runs)
+    return best
+
+def deadwood(hand):
+    """ points left in hand after the best arrangement """
+    return best_deadwood(hand)[0]
+
+def pairs(hand):
+    """ the largest list of disjoint pairs (two cards of a rank or two
+        adjacent cards of a suit) among the cards of hand """
+    if not hand:
+        return []
+    low = hand & -hand
+    i = low.bit_length() - 1
+    best = pairs(hand ^ low)
+    partners = (hand & RANK_COLUMN[i % 13]) & ~low
+    if i % 13 < 12:
+        partners |= hand & (low << 1)
+    for j in iter_bits(partners):
+        ps = [low | 1 << j] + pairs(hand & ~(low | 1 << j))
+        if len(ps) > len(best):
+            best = ps
+    return best
+
+def arrangement(hand):
+    """ the best arrangement as masks: melds, then pairs from the deadwood,
+        then the single cards that are left """
+    pts, melds = best_deadwood(hand)
+    rest = hand
+    for m in melds:
+        rest &= ~m
+    groups = melds + pairs(rest)
+    for p in groups[len(melds):]:
+        rest &= ~p
+    return groups + [1 << i for i in iter_bits(rest)]
+
+def candidate_melds(hand):
+    """ the melds that can be made from hand: runs of 3 to 5 cards, the
+        sets and the sets of 3 inside a set of 4 """
+    melds = []
+    for row in range(4):
+        melds += [m << (13 * row) for m in RUN_MASKS[suit_ranks(hand, row)]
+                  if popcount(m) >= 3]
+    for column in RANK_COLUMN:
+        cards = hand & column
+        if popcount(cards) >= 3:
+            melds.append(cards)
+            if popcount(cards) == 4:
+                melds += [cards & ~(1 << i) for i in iter_bits(cards)]
+    return melds
+
+def ranked(hand, k = None):
+    """ generate (points, arrangement) for the arrangements of hand in
+        order of deadwood, least first, at most k of them. An arrangement
+        is a largest choice of disjoint melds (no other meld fits in the
+        cards left), then pairs, then single cards, as masks like
+        arrangement() gives.
+
+        Best first search over taking or leaving each candidate meld. A
+        node's bound is the points of the cards no meld still open to it
+        can cover, which never overestimates, so an arrangement comes off
+        the heap only when nothing left can beat it. Only the nodes on
+        the frontier are kept, not the whole arrangement space. """
+    melds = candidate_melds(hand)
+    n = len(melds)
+    meldable = 0
+    for m in melds:
+        meldable |= m
+    heap = [(mask_points(hand & ~meldable), 0, 0, 0, ())]
+    count = 0
+    pushed = 1
+    while heap and (k is None or count < k):
+        bound, depth, order, used, chosen = heapq.heappop(heap)
+        i = -depth
+        if i == n:
+            if any([not m & used for m in melds]):
+                continue
+            rest = hand & ~used
+            groups = list(chosen) + pairs(rest)
+            for p in groups[len(chosen):]:
+                rest &= ~p
+            count += 1
+            yield bound, groups + [1 << j for j in iter_bits(rest)]
+            continue
+        m = melds[i]
+        children = [(used, chosen)]
+        if not m & used:
+            children.append((used | m, chosen + (m,)))
+        for u, c in children:
+            open_cards = 0
+            for later in melds[i + 1:]:
+                if not later & u:
+                    open_cards |= later
+            pushed += 1
+            heapq.heappush(heap, (mask_points(hand & ~u & ~open_cards), -(i + 1),
+                                  pushed, u, c))
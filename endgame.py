@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+""" depth limited endgame search with perfect information
+
+    Near the end of a deal few cards are left in the pick pile and the
+    game tree is small enough to search. The search sees everything,
+    both hands and the order of the pile, so it is an oracle (an upper
+    bound on play, or a referee for a strategy) rather than a fair
+    player. A turn is a choice of taking the discard or drawing, then of
+    the card to throw, and the rules are those of sapphire.deal(): a
+    player whose hand is within the knock value at the start of the turn
+    or after the throw wins the opponent's deadwood, and a deal that gets
+    to 2 cards in the pile or to 50 turns scores nothing.
+
+    The search is negamax with alpha-beta and iterative deepening to at
+    most max_plies turns. It is depth limited: a position still open at
+    the last ply is scored 0, which is a guess, not a result. solve()
+    only returns a move when a depth finished with every line played to
+    the end of the deal, so the move is exact, and the caller plays by
+    its own rules otherwise. Moves are made and taken back on the deck
+    itself (Deck.apply and Deck.undo), so the HandStates of the two hands
+    are kept up to date one card at a time and the transposition table
+    is keyed by the deck's Zobrist key of the card locations, with the
+    top discard, the side to move and the turn number (the 50 turn limit
+    depends on it). Moves are tried in order of the deadwood they leave,
+    the table's best move first. The table has a size cap and the search
+    node and time limits, when a limit is hit the move of the last
+    finished depth is used. """
+
+import random
+from timeit import default_timer as timer
+from masks import popcount
+
+EXACT, LOWER, UPPER = 0, 1, 2
+INFINITY = 1000
+LAST_TURN = 50
+SEATS = 'hu'
+
+_rng = random.Random(52)
+TOP_KEYS = [_rng.getrandbits(64) for i in range(52)]
+TURN_KEYS = [_rng.getrandbits(64) for i in range(LAST_TURN + 1)]
+SIDE_KEY = _rng.getrandbits(64)
+
+class Aborted(Exception):
+    """ the search ran out of nodes or time """
+
+class Solver(object):
+    """ search with a transposition table of at most max_entries, giving
+        up after max_nodes positions or max_ms milliseconds """
+    def __init__(self, max_entries = 1 << 18, max_nodes = 200000, max_ms = 500,
+                 max_plies = 12):
+        self.max_entries = max_entries
+        self.max_nodes = max_nodes
+        self.max_ms = max_ms
+        self.max_plies = max_plies
+        self.table = {}
+        self.nodes = 0
+        self.cuts = 0
+
+    def moves(self, seat, top, pick):
+        """ (deadwood left, took the discard, card taken, card thrown) for
+            every move, least deadwood first, cards as indices. The card
+            is put in the hand to read the deadwood of each throw from
+            its HandState and taken back """
+        deck = self.deck
+        location = SEATS[seat]
+        result = []
+        for took, card in ((True, top), (False, pick)):
+            deck.apply((deck.cards[card], location))
+            for throw, pts, melded in deck.hands[location].each_removed():
+                result.append((pts, took, card, throw.bit_length() - 1))
+            deck.undo()
+        result.sort()
+        return result
+
+    def search(self, seat, top, drawn, turns, plies, alpha, beta):
+        """ (value for the side to move, best move) """
+        self.nodes += 1
+        if self.nodes > self.max_nodes or (self.nodes & 255 == 0 and timer() > self.deadline):
+            raise Aborted
+        deck = self.deck
+        me, opp = deck.hands[SEATS[seat]], deck.hands[SEATS[1 - seat]]
+        if me.can_knock(self.knock):
+            return opp.deadwood(), None
+        if plies == 0:
+            self.cuts += 1
+            return 0, None
+        key = deck.key ^ TOP_KEYS[top] ^ TURN_KEYS[turns] ^ (SIDE_KEY if seat else 0)
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            depth, value, flag, move, cut = entry
+            if depth >= plies and (flag == EXACT or
+                                   flag == LOWER and value >= beta or
+                                   flag == UPPER and value <= alpha):
+                self.cuts += cut
+                return value, move
+            first = move
+        moves = self.moves(seat, top, self.pile[drawn])
+        if first is not None:
+            moves.sort(key = lambda m: (m[1:] != first))
+        cards = deck.cards
+        location = SEATS[seat]
+        cuts = self.cuts
+        start_alpha = alpha
+        best, best_move = -INFINITY, None
+        for pts, took, card, throw in moves:
+            new_drawn = drawn if took else drawn + 1
+            left = len(self.pile) - new_drawn
+            if pts <= self.knock:
+                value = opp.deadwood() if left > 2 else 0
+            elif left <= 2 or turns >= LAST_TURN:
+                value = 0
+            else:
+                deck.apply((cards[card], location))
+                deck.apply((cards[throw], 'd'))
+                try:
+                    value = -self.search(1 - seat, throw, new_drawn, turns + 1,
+                                         plies - 1, -beta, -alpha)[0]
+                finally:
+                    deck.undo(2)
+            if value > best:
+                best, best_move = value, (took, card, throw)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        if best <= start_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if key in self.table or len(self.table) < self.max_entries:
+            self.table[key] = (plies, best, flag, best_move, int(self.cuts > cuts))
+        return best, best_move
+
+    def solve(self, deck, seat, top, pile, knock, turns):
+        """ (value, (took the discard, card taken, card thrown)) for the
+            side seat (0 sapphire, 1 the opponent) to move on deck, top
+            and pile are card indices. The move is None unless a depth
+            finished with no line cut off by the ply limit. The deck is
+            left as it was """
+        self.deck = deck
+        self.pile = pile
+        self.knock = knock
+        self.table.clear()
+        self.nodes = 0
+        self.deadline = timer() + self.max_ms / 1000.0
+        result = (0, None)
+        try:
+            for plies in range(2, self.max_plies + 1, 2):
+                self.cuts = 0
+                value = self.search(seat, top, 0, turns, plies, -INFINITY, INFINITY)
+                if not self.cuts:
+                    result = value
+                    break
+        except Aborted:
+            pass
+        self.deck = None
+        return result
+
+solver = Solver()
+
+def solve(deck, location, discard, knock_value, turns):
+    """ the move for location on deck as (take the discard, card to throw),
+        or None when the search could not see to the end of the deal """
+    seat = SEATS.index(location)
+    left = popcount(deck.masks.get('p', 0))
+    pile = [c.index for c in deck.order[52 - left:]]
+    value, move = solver.solve(deck, seat, discard.index, pile, knock_value, turns)
+    if move is None:
+        return None
+    took, card, throw = move
+    return took, deck.cards[throw]
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+""" a hand kept up to date one card at a time
+
+    A move changes one suit pattern and one rank count, so HandState only
+    looks up the new pattern in the tables of tables.py and adjusts the
+    count. Scoring is then four lookups, or a few more when the hand holds
+    3 or 4 of a rank and the sets have to be tried (as in deadwood.py). """
+
+from itertools import product
+from masks import *
+from tables import BEST, COVER, RUN_MASKS
+import instrument
+
+def set_choices(suits, triples):
+    """ generate (rest, sets, melded) for every choice of sets from the
+        ranks held 3 or 4 times: the suit patterns left, the mask of the
+        cards in sets and how many there are """
+    choices = []
+    for col in triples:
+        rows = [row for row in range(4) if suits[row] >> col & 1]
+        options = [(), tuple(rows)]
+        if len(rows) == 4:
+            options += [tuple([r for r in rows if r != s]) for s in rows]
+        choices.append(options)
+    for chosen in product(*choices):
+        rest = list(suits)
+        sets = 0
+        cards = 0
+        for col, rows in zip(triples, chosen):
+            for row in rows:
+                rest[row] &= ~(1 << col)
+                sets |= 1 << (row * 13 + col)
+            cards += len(rows)
+        yield rest, sets, cards
+
+def _count(name, suits, triples):
+    """ record for instrument.py how many choices of sets a hand has """
+    n = 1
+    for col in triples:
+        n *= 6 if all([p >> col & 1 for p in suits]) else 2
+    instrument.count(name, n, sum([p << (13 * row) for row, p in enumerate(suits)]))
+
+def score(suits, triples):
+    """ (least deadwood, most melded cards) of a hand given by its four
+        13 bit suit patterns and the ranks it holds 3 or 4 cards of """
+    if not triples:
+        return (sum([BEST[p][0] for p in suits]), sum([COVER[p] for p in suits]))
+    if instrument.enabled:
+        _count('score.set_choices', suits, triples)
+    deadwood, melded = 1000, 0
+    for rest, sets, cards in set_choices(suits, triples):
+        deadwood = min(deadwood, sum([BEST[p][0] for p in rest]))
+        melded = max(melded, cards + sum([COVER[p] for p in rest]))
+    return deadwood, melded
+
+def within(suits, triples, limit):
+    """ whether the least deadwood of the hand is limit or less. Each
+        choice of sets is given up as soon as its running deadwood goes
+        over the limit and the first choice within it answers, so a hand
+        that cannot knock (most of them) costs a few lookups """
+    if not triples:
+        total = 0
+        for p in suits:
+            total += BEST[p][0]
+            if total > limit:
+                return False
+        return True
+    for rest, sets, cards in set_choices(suits, triples):
+        total = 0
+        for p in rest:
+            total += BEST[p][0]
+            if total > limit:
+                break
+        else:
+            return True
+    return False
+
+def can_knock(hand, limit):
+    """ whether the 52 bit mask hand has limit or fewer points of
+        deadwood, without finding its best arrangement """
+    suits = [suit_ranks(hand, row) for row in range(4)]
+    triples = [col for col in range(13) if popcount(hand & RANK_COLUMN[col]) >= 3]
+    return within(suits, triples, limit)
+
+class HandState(object):
+    """ the suits, rank counts and score of a hand, cards are added and
+        removed as 52 bit masks of a single card """
+    def __init__(self, hand = 0):
+        self.clear()
+        for i in iter_bits(hand):
+            self.add(1 << i)
+
+    def clear(self):
+        self.hand = 0
+        self.suits = [0, 0, 0, 0]
+        self.counts = [0] * 13
+        self.triples = []
+        self.result = (0, 0)
+
+    def _move(self, card, step):
+        row, col = divmod(card.bit_length() - 1, 13)
+        self.hand ^= card
+        self.suits[row] ^= 1 << col
+        self.counts[col] += step
+        if self.counts[col] >= 3:
+            if col not in self.triples:
+                self.triples.append(col)
+        elif col in self.triples:
+            self.triples.remove(col)
+        self.result = None
+
+    def add(self, card):
+        self._move(card, 1)
+
+    def remove(self, card):
+        self._move(card, -1)
+
+    def _score(self):
+        if self.result is None:
+            self.result = score(self.suits, self.triples)
+        return self.result
+
+    def deadwood(self):
+        """ points left after the best arrangement """
+        return self._score()[0]
+
+    def can_knock(self, limit):
+        """ whether deadwood() <= limit, from the score when it is known """
+        if self.result is not None:
+            return self.result[0] <= limit
+        return within(self.suits, self.triples, limit)
+
+    def melded(self):
+        """ most cards that can be put in melds """
+        return self._score()[1]
+
+    def runs(self):
+        """ masks of the runs of 2 to 5 cards in the hand """
+        return [m << (13 * row) for row in range(4) for m in RUN_MASKS[self.suits[row]]]
+
+    def sets(self):
+        """ masks of the ranks held 2 or more times """
+        return [self.hand & RANK_COLUMN[col] for col in range(13) if self.counts[col] >= 2]
+
+    def melds(self):
+        """ the candidate melds: runs and sets of 3 or more (and the sets
+            of 3 inside a set of 4) """
+        melds = [r for r in self.runs() if popcount(r) >= 3]
+        for col in self.triples:
+            cards = self.hand & RANK_COLUMN[col]
+            melds.append(cards)
+            if self.counts[col] == 4:
+                melds += [cards & ~(1 << i) for i in iter_bits(cards)]
+        return melds
+
+    def if_added(self, card):
+        """ (deadwood, melded) the hand would have with card added, the
+            hand itself is left alone """
+        row, col = divmod(card.bit_length() - 1, 13)
+        suits = list(self.suits)
+        suits[row] |= 1 << col
+        triples = self.triples
+        if self.counts[col] == 2:
+            triples = triples + [col]
+        return score(suits, triples)
+
+    def if_removed(self, card):
+        """ (deadwood, melded) the hand would have without card """
+        row, col = divmod(card.bit_length() - 1, 13)
+        suits = list(self.suits)
+        suits[row] &= ~(1 << col)
+        triples = self.triples
+        if self.counts[col] == 3:
+            triples = [t for t in triples if t != col]
+        return score(suits, triples)
+
+    def each_removed(self):
+        """ [(card, deadwood, melded)] for the hand without each of its
+            cards in turn. The hand without a card has the same choices
+            of sets minus those using the card, so each choice is looked
+            up once and only the suit of the card changes """
+        hand = list(iter_bits(self.hand))
+        pts = [1000] * len(hand)
+        melded = [0] * len(hand)
+        if instrument.enabled and self.triples:
+            _count('each_removed.set_choices', self.suits, self.triples)
+        for rest, sets, cards in set_choices(self.suits, self.triples):
+            suit_pts = [BEST[p][0] for p in rest]
+            suit_cover = [COVER[p] for p in rest]
+            total_pts = sum(suit_pts)
+            total_cover = cards + sum(suit_cover)
+            for k, i in enumerate(hand):
+                if sets >> i & 1:
+                    continue
+                row, col = divmod(i, 13)
+                p = rest[row] & ~(1 << col)
+                pts[k] = min(pts[k], total_pts - suit_pts[row] + BEST[p][0])
+                melded[k] = max(melded[k], total_cover - suit_cover[row] + COVER[p])
+        return [(1 << i, pts[k], melded[k]) for k, i in enumerate(hand)]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+""" sampling the opponent's hand
+
+    From one side of the table the opponent's hand is known to hold the
+    cards it took from the discard pile (and any cards in 'k'), and the
+    rest of it is some set of the cards that side cannot see: neither in
+    its own hand nor in the discards. A Sampler keeps a set of such
+    hands for a deal, repairs them as cards move instead of drawing new
+    ones, and scores candidate throws against all of them: how often the
+    opponent would take the card (it lets them meld more cards, the rule
+    of should_take_discard) and how much deadwood it would save them.
+
+    Scoring runs until a time budget is spent, so a decision costs about
+    the same whatever the hand. With budget_ms = None a fixed number of
+    samples is used and decisions are reproducible. """
+
+import random
+from timeit import default_timer as timer
+from masks import *
+from handstate import HandState
+
+class Sampler(object):
+    """ opponent hands consistent with what one location has seen """
+    def __init__(self, rng = None, keep = 256):
+        self.rng = rng or random.Random()
+        self.keep = keep
+        self.samples = []
+        self.pool = []
+        self.known = 0
+        self.size = 0
+
+    def _fill(self, hand):
+        """ hand brought to size: cards from the pool are added, or cards
+            that are not known to be there dropped """
+        need = self.size - popcount(hand)
+        if need < 0:
+            loose = list(iter_bits(hand & ~self.known))
+            for i in self.rng.sample(loose, -need):
+                hand &= ~(1 << i)
+        elif need > 0:
+            free = [i for i in self.pool if not hand >> i & 1]
+            for i in self.rng.sample(free, min(need, len(free))):
+                hand |= 1 << i
+        return hand
+
+    def update(self, deck, location, opponent):
+        """ bring the kept samples in line with the deck as location sees
+            it: cards it now holds or that were thrown leave the samples
+            and cards the opponent took go in """
+        unseen = FULL & ~deck.masks.get(location, 0) & ~deck.masks.get('d', 0)
+        self.known = (deck.taken.get(opponent, 0) | deck.masks.get('k', 0)) & unseen
+        self.size = popcount(deck.masks.get(opponent, 0) | deck.masks.get('k', 0))
+        allowed = unseen & ~self.known
+        self.pool = list(iter_bits(allowed))
+        self.samples = [self._fill(s & allowed | self.known) for s in self.samples]
+
+    def sample(self, i):
+        """ the i'th kept sample, drawn when needed """
+        while i >= len(self.samples):
+            hand = self._fill(self.known)
+            if len(self.samples) >= self.keep:
+                return hand
+            self.samples.append(hand)
+        return self.samples[i]
+
+    def risks(self, cards, budget_ms = 5, least = 16, most = 256):
+        """ {card: (how often the opponent takes it, mean deadwood it saves
+            them)} for each card mask in cards, using at least least and
+            at most most samples, stopping after budget_ms """
+        start = timer()
+        takes = dict([(c, 0) for c in cards])
+        saved = dict([(c, 0) for c in cards])
+        n = 0
+        while n < most:
+            hand = self.sample(n)
+            state = HandState(hand)
+            melded = state.melded()
+            pts = state.deadwood()
+            for c in cards:
+                if hand & c:
+                    continue
+                if state.if_added(c)[1] > melded:
+                    takes[c] += 1
+                    after = HandState(hand | c).each_removed()
+                    saved[c] += pts - min([p for card, p, m in after])
+            n += 1
+            if n >= least and budget_ms is not None and (timer() - start) * 1000 >= budget_ms:
+                break
+            if budget_ms is None and n >= least:
+                break
+        return dict([(c, (float(takes[c]) / n, float(saved[c]) / n)) for c in cards])
+
+def sampler(deck, location):
+    """ the Sampler of location for the deal on deck, brought up to date,
+        its random numbers are seeded by the shuffle so they do not touch
+        the deck's own rng and a replayed deal samples the same hands """
+    opponent = 'u' if location == 'h' else 'h'
+    s = deck.samplers.get(location)
+    if s is None:
+        s = Sampler(random.Random(hash((tuple(deck.record()), location))))
+        deck.samplers[location] = s
+    s.update(deck, location, opponent)
+    return s
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+""" opt-in profiling of the phases of a game
+
+    enable() swaps the phase functions of sapphire.py for timed wrappers
+    and disable() puts the originals back, so with it off nothing runs
+    but a test of `enabled` where values are counted. Times are kept
+    per call stack ('deal;take_turn;choose_throw') for the whole session
+    and for each match, together with counted values and the hands that
+    made them largest. A deal scores hands with handstate.py, which
+    counts the choices of sets it tries (score.set_choices and
+    each_removed.set_choices). The sizes of the lists p and q in
+    sapphire.arrangements are only counted when possibilities() is
+    called, which deals no longer do.
+
+        import instrument, sapphire
+        instrument.enable()
+        sapphire.play()
+        instrument.report()
+        open('gin.folded', 'w').write(instrument.collapsed())
+"""
+
+import json
+from timeit import default_timer as timer
+
+PHASES = ['play', 'match', 'deal', 'start_deal', 'take_turn', 'hand_points',
+          'can_knock', 'should_take_discard', 'pick_from_deck', 'choose_throw',
+          'sapphire_throw', 'evaluate_discards', 'best_hand', 'possibilities',
+          'arrangements', 'wildness']
+WORST = 10
+
+enabled = False
+_originals = {}
+_stack = []
+
+class Profile(object):
+    """ call counts and times per call stack, and counted values """
+    def __init__(self):
+        self.calls = {}
+        self.counts = {}
+        self.worst = {}
+
+    def add(self, path, seconds):
+        entry = self.calls.get(path)
+        if entry is None:
+            self.calls[path] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name, value, hand = None):
+        entry = self.counts.get(name)
+        if entry is None:
+            self.counts[name] = [1, value, value]
+        else:
+            entry[0] += 1
+            entry[1] += value
+            entry[2] = max(entry[2], value)
+        if hand is not None:
+            worst = self.worst.setdefault(name, [])
+            if len(worst) < WORST or value > worst[-1][0]:
+                worst.append((value, hand))
+                worst.sort(reverse = True)
+                del worst[WORST:]
+
+    def self_times(self):
+        """ seconds spent in each call stack outside its callees """
+        own = dict([(path, entry[1]) for path, entry in self.calls.items()])
+        for path, entry in self.calls.items():
+            parent = path.rpartition(';')[0]
+            if parent in own:
+                own[parent] -= entry[1]
+        return own
+
+    def as_dict(self):
+        return {'phases': dict([(path, {'calls': n, 'seconds': s})
+                                for path, (n, s) in self.calls.items()]),
+                'counts': dict([(name, {'samples': n, 'total': t, 'max': m})
+                                for name, (n, t, m) in self.counts.items()]),
+                'worst': dict([(name, [{'value': v, 'hand': '%013x' % h} for v, h in w])
+                               for name, w in self.worst.items()])}
+
+session = Profile()
+matches = []
+_match = None
+
+def count(name, value, hand = None):
+    """ record a counted value, such as the size of a list """
+    session.count(name, value, hand)
+    if _match is not None:
+        _match.count(name, value, hand)
+
+def _timed(name, func):
+    def timed(*args, **kwargs):
+        global _match
+        if name == 'match':
+            _match = Profile()
+        _stack.append(name)
+        start = timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = timer() - start
+            path = ';'.join(_stack)
+            _stack.pop()
+            session.add(path, seconds)
+            if _match is not None:
+                _match.add(path, seconds)
+            if name == 'match':
+                matches.append(_match)
+                _match = None
+    timed.__name__ = func.__name__
+    timed.__doc__ = func.__doc__
+    return timed
+
+def enable(module = None):
+    """ start timing the phases of module (sapphire by default) """
+    global enabled
+    if module is None:
+        import sapphire as module
+    if enabled:
+        return
+    for name in PHASES:
+        func = getattr(module, name, None)
+        if func is not None:
+            _originals[name] = func
+            setattr(module, name, _timed(name, func))
+    _originals[None] = module
+    enabled = True
+
+def disable():
+    """ put the untimed functions back """
+    global enabled
+    if not enabled:
+        return
+    module = _originals.pop(None)
+    for name, func in _originals.items():
+        setattr(module, name, func)
+    _originals.clear()
+    enabled = False
+
+def reset():
+    global session, _match
+    session = Profile()
+    _match = None
+    del matches[:]
+
+def to_json(path = None):
+    """ the session and every match as JSON, written to path if given """
+    text = json.dumps({'session': session.as_dict(),
+                       'matches': [m.as_dict() for m in matches]},
+                      indent = 2, sort_keys = True)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    return text
+
+def collapsed(profile = None):
+    """ folded stacks ('deal;take_turn 1234' in microseconds of self time)
+        for flamegraph.pl and compatible viewers """
+    own = (profile or session).self_times()
+    return ''.join(['%s %i\n' % (path, max(s, 0) * 1e6)
+                    for path, s in sorted(own.items())])
+
+def report(profile = None):
+    profile = profile or session
+    print '%-60s %8s %10s %10s' % ('PHASE', 'CALLS', 'TOTAL S', 'MEAN US')
+    for path, (n, s) in sorted(profile.calls.items()):
+        print '%-60s %8i %10.3f %10.1f' % (path, n, s, s / n * 1e6)
+    for name, (n, total, most) in sorted(profile.counts.items()):
+        print '%-30s samples: %8i mean: %8.1f max: %6i' % (name, n, float(total) / n, most)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+""" 52 bit card masks. Card (row, col) is bit row * 13 + col, rows are the
+    suits SCHD and cols the ranks A23456789TJQK, so each suit is a 13 bit
+    field and a group of cards is a single int """
+
+SUITS = 'SCHD'
+RANKS = 'A23456789TJQK'
+SUIT_BITS = (1 << 13) - 1
+FULL = (1 << 52) - 1
+
+def _column(col):
+    """ the four cards of rank col, built in a function so the loop
+        variables do not leak into 'from masks import *' """
+    return sum([1 << (row * 13 + col) for row in range(4)])
+
+# the four cards of each rank
+RANK_COLUMN = map(_column, range(13))
+
+def bit(row, col):
+    """ the mask of a single card """
+    return 1 << (row * 13 + col)
+
+def popcount(mask):
+    """ number of cards in mask """
+    return bin(mask).count('1')
+
+def iter_bits(mask):
+    """ indices of the cards in mask, lowest first (ie. deck order) """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def suit_ranks(mask, row):
+    """ the 13 bit rank pattern of suit row in mask """
+    return (mask >> (row * 13)) & SUIT_BITS
+
+def run_starts(ranks, n):
+    """ bits of the ranks that begin n consecutive ranks in a 13 bit pattern """
+    starts = ranks
+    for k in range(1, n):
+        starts &= ranks >> k
+    return starts
+
+def run_mask(row, col, n):
+    """ mask of the run of length n starting at (row, col) """
+    return ((1 << n) - 1) << (row * 13 + col)
+
+def disjoint(seq):
+    """ True if no two of the masks in seq share a card """
+    seen = 0
+    for m in seq:
+        if seen & m:
+            return False
+        seen |= m
+    return True
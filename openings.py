@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+""" a database of the 10 card hands a deal can open with
+
+    Hands that differ only by a renaming of the suits score the same, so
+    only canonical hands are stored (canonical.py: suit patterns in
+    decreasing order). Written as four 13 bit patterns p0 >= p1 >= p2 >= p3
+    a canonical key sorts by p3 first, so enumerating p3, p2, p1 and p0 in
+    increasing order gives the keys in sorted order with no sorting step.
+
+    The number of hands per lowest pattern is very uneven (p3 = 0 alone
+    has about 106 million of them), so the build is split into shards of
+    a range of p2 for one p3, cut so each holds about target hands; the
+    number of hands of a (p3, p2) prefix is counted, not enumerated, so
+    the plan is cheap. Each shard is written to its own file in a
+    directory by a pool of processes. A shard file is renamed into place
+    when finished, so a build that is stopped picks up again at the
+    shards that are missing. merge() then joins the shards, in key order,
+    into the database: a header and 16 byte records
+
+        key << 7 | deadwood, melds
+
+    found by binary search on a memory map. The melds of the best
+    arrangement are packed 16 bits each (at most 3 fit in 10 cards): a
+    run as its suit, first rank and length, a set as its rank and suits.
+    Only hands with at least min_melded cards in melds are stored (there
+    are about 670 million canonical hands in all), lookup() is None for
+    the others.
+
+        python openings.py build parts -p 8
+        python openings.py merge parts openings.db
+        db = openings.Openings('openings.db')
+        db.lookup(deck.masks['h'])
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import parallel
+from masks import *
+from deadwood import best_deadwood
+from canonical import canonical, permute
+
+MAGIC = 'GINO'
+VERSION = 2
+HEADER = struct.Struct('<4sBBxxQ')
+RECORD = struct.Struct('<QQ')
+SIZE = 10
+TARGET = 1 << 21
+RUN, SET = 0, 1 << 15
+
+# the 13 bit patterns holding exactly / at most n cards, in increasing order
+EXACTLY = [[p for p in range(1 << 13) if popcount(p) == n] for n in range(14)]
+AT_MOST = [[p for p in range(1 << 13) if popcount(p) <= n] for n in range(14)]
+
+def hands(p3, size = SIZE, low = 0, high = None):
+    """ generate the canonical hands of size cards whose lowest suit
+        pattern is p3 and next p2 with low <= p2 < high, in increasing
+        order """
+    left = size - popcount(p3)
+    if left < 0:
+        return
+    after = AT_MOST[left]
+    stop = len(after) if high is None else bisect.bisect_left(after, high)
+    for p2 in after[bisect.bisect_left(after, max(p3, low)):stop]:
+        left2 = left - popcount(p2)
+        after2 = AT_MOST[left2]
+        for p1 in after2[bisect.bisect_left(after2, p2):]:
+            last = EXACTLY[left2 - popcount(p1)]
+            base = p1 << 13 | p2 << 26 | p3 << 39
+            for p0 in last[bisect.bisect_left(last, p1):]:
+                yield base | p0
+
+def _tails(size):
+    """ tails[n][i]: the number of (p1, p0) with p0 >= p1 >= the i'th
+        pattern of AT_MOST[n] and n cards between them """
+    tails = []
+    for n in range(size + 1):
+        counts = [len(EXACTLY[n - popcount(p)]) -
+                  bisect.bisect_left(EXACTLY[n - popcount(p)], p) for p in AT_MOST[n]]
+        tails.append(_suffix_sums(counts))
+    return tails
+
+def _suffix_sums(counts):
+    sums = [0] * (len(counts) + 1)
+    for i in range(len(counts) - 1, -1, -1):
+        sums[i] = sums[i + 1] + counts[i]
+    return sums
+
+def plan(size = SIZE, target = TARGET):
+    """ the shards as (p3, low, high) (high None for no limit) in key
+        order, cut to about target hands each """
+    tails = _tails(size)
+    def count(p2, left):
+        """ hands with next pattern p2 and left cards for p2, p1 and p0 """
+        n = left - popcount(p2)
+        return tails[n][bisect.bisect_left(AT_MOST[n], p2)]
+    # totals[n][i]: hands with p2 >= the i'th pattern of AT_MOST[n]
+    totals = [_suffix_sums([count(p2, n) for p2 in AT_MOST[n]]) for n in range(size + 1)]
+    shards = []
+    for p3 in AT_MOST[size]:
+        left = size - popcount(p3)
+        after = AT_MOST[left]
+        first = bisect.bisect_left(after, p3)
+        if totals[left][first] == 0:
+            continue
+        if totals[left][first] <= target:
+            shards.append((p3, 0, None))
+            continue
+        low, held = 0, 0
+        for p2 in after[first:]:
+            n = count(p2, left)
+            if n == 0:
+                continue
+            if held and held + n > target:
+                shards.append((p3, low, p2))
+                low, held = p2, 0
+            held += n
+        shards.append((p3, low, None))
+    return shards
+
+def encode(melds):
+    """ melds (52 bit masks) packed 16 bits each """
+    packed = 0
+    for i, m in enumerate(melds):
+        cols = [col for col in range(13) if m & RANK_COLUMN[col]]
+        if len(cols) == 1:
+            rows = sum([1 << row for row in range(4) if m >> (row * 13 + cols[0]) & 1])
+            code = SET | cols[0] << 4 | rows
+        else:
+            row = (m.bit_length() - 1) // 13
+            code = RUN | row << 8 | cols[0] << 4 | len(cols)
+        packed |= code << (16 * i)
+    return packed
+
+def decode(packed):
+    """ the meld masks of a packed value """
+    melds = []
+    while packed:
+        code = packed & 0xffff
+        packed >>= 16
+        if code & SET:
+            col = code >> 4 & 15
+            melds.append(sum([1 << (row * 13 + col) for row in range(4) if code >> row & 1]))
+        else:
+            melds.append(run_mask(code >> 8 & 3, code >> 4 & 15, code & 15))
+    return melds
+
+def record(hand):
+    """ (deadwood, melds) of the best arrangement of hand """
+    return best_deadwood(hand)
+
+def shard_path(parts, shard):
+    p3, low, high = shard
+    return os.path.join(parts, '%04x-%04x.part' % (p3, low))
+
+def build_shard(args):
+    """ write the records of a shard to its file, (shard, records) """
+    parts, shard, size, min_melded = args
+    path = shard_path(parts, shard)
+    count = 0
+    with open(path + '.tmp', 'wb') as f:
+        for hand in hands(shard[0], size, shard[1], shard[2]):
+            pts, melds = record(hand)
+            if sum([popcount(m) for m in melds]) >= min_melded:
+                f.write(RECORD.pack(hand << 7 | pts, encode(melds)))
+                count += 1
+    os.rename(path + '.tmp', path)
+    return shard, count
+
+def build(parts, processes = None, size = SIZE, min_melded = 3, progress = True,
+          target = TARGET):
+    """ build the missing shards in directory parts """
+    if not os.path.isdir(parts):
+        os.makedirs(parts)
+    meta = {'version': VERSION, 'size': size, 'min_melded': min_melded, 'target': target}
+    meta_path = os.path.join(parts, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) != meta:
+                raise ValueError('%s was built with other settings' % parts)
+    else:
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+    todo = [(parts, shard, size, min_melded) for shard in plan(size, target)
+            if not os.path.exists(shard_path(parts, shard))]
+    done = parallel.results(build_shard, todo, processes, ordered = False)
+    for i, (shard, count) in enumerate(done):
+        if progress:
+            print '%6i/%i shard %04x-%04x: %i hands' % (i + 1, len(todo), shard[0], shard[1], count)
+
+def merge(parts, path):
+    """ join the shards of parts into the database at path """
+    with open(os.path.join(parts, 'meta.json')) as f:
+        meta = json.load(f)
+    shards = [shard_path(parts, shard) for shard in plan(meta['size'], meta['target'])]
+    missing = [s for s in shards if not os.path.exists(s)]
+    if missing:
+        raise ValueError('%i shards are not built yet' % len(missing))
+    count = sum([os.path.getsize(s) for s in shards]) // RECORD.size
+    with open(path + '.tmp', 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, meta['min_melded'], count))
+        for s in shards:
+            with open(s, 'rb') as f:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+    os.rename(path + '.tmp', path)
+    return count
+
+class Openings(object):
+    """ the database at path, memory mapped """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version, self.min_melded, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %i openings database' % (path, VERSION))
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """ (deadwood, packed melds) stored for a canonical key, or None """
+        lo, hi = 0, self.count
+        unpack = RECORD.unpack_from
+        while lo < hi:
+            mid = (lo + hi) // 2
+            packed, melds = unpack(self.map, HEADER.size + mid * RECORD.size)
+            found = packed >> 7
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return packed & 127, melds
+        return None
+
+    def lookup(self, hand):
+        """ (deadwood, melds) of hand, a 52 bit mask, or None if it is not
+            stored, melds are 52 bit masks in the suits of hand """
+        key, perm = canonical(hand)
+        found = self.find(key)
+        if found is None:
+            return None
+        return found[0], [permute(m, perm) for m in decode(found[1])]
+
+    def close(self):
+        self.map.close()
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'build the opening hand database')
+    commands = parser.add_subparsers(dest = 'command')
+    b = commands.add_parser('build', help = 'build the missing shards')
+    b.add_argument('parts', help = 'directory of shards')
+    b.add_argument('-p', '--processes', type = int, default = None)
+    b.add_argument('-m', '--min-melded', type = int, default = 3,
+                   help = 'least number of cards in melds a stored hand has')
+    m = commands.add_parser('merge', help = 'join the shards into a database')
+    m.add_argument('parts')
+    m.add_argument('output')
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        build(args.parts, args.processes, min_melded = args.min_melded)
+    else:
+        print '%i hands' % merge(args.parts, args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
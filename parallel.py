@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+""" map a function over jobs on a pool of processes
+
+    results() is the one place the pool is handled: results stream back
+    as they are made, the pool is closed when all are in and terminated
+    if the caller stops early or something raises, and processes = 1
+    runs everything in this process without a pool. func has to be
+    picklable (a module level function) for the pool. """
+
+from multiprocessing import Pool, cpu_count
+
+def results(func, jobs, processes = None, chunksize = 1, ordered = True):
+    """ generate func(job) for each job, in the order of jobs or, with
+        ordered = False, as they finish """
+    if processes == 1:
+        for job in jobs:
+            yield func(job)
+        return
+    pool = Pool(processes or cpu_count())
+    try:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        for r in mapper(func, jobs, chunksize):
+            yield r
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+""" compact binary records of played deals
+
+    deal(deck, sink = writer.event) reports every card action as an event
+    of two bytes, a kind and a card index (row * 13 + col) or a number:
+
+        SHUFFLE card    52 of them, the shuffle in position order, which
+                        gives both hands and the up card
+        KNOCK value     the knock value of the deal
+        TAKE + seat     the seat (0 sapphire, 1 the opponent) took the
+                        discard, DRAW + seat drew from the pile and
+                        THROW + seat threw the card
+        TURNS n         turns played
+        END + winner    the score, winner is 0 for no one, 1 for sapphire
+                        and 2 for the opponent
+
+    A Writer appends events to a file in chunks of whole deals, each a
+    header (magic, version, number of events, crc32 of the payload) and
+    the payload, so
+    memory use is one chunk whatever the length of the run and a run can
+    be continued by opening the file again. A chunk cut short by a crash
+    is ignored by the readers, which read one chunk at a time, and cut
+    off when the file is next opened for writing.
+
+        with records.Writer('games.gin') as w:
+            for i in range(1000):
+                sapphire.deal(deck, sink = w.event)
+        for d in records.deals('games.gin'):
+            print d.knock, d.winner, d.score
+"""
+
+import os
+import struct
+import zlib
+from array import array
+
+SHUFFLE, KNOCK, TAKE, DRAW, THROW, TURNS, END = 0, 1, 2, 4, 6, 8, 9
+NAMES = {SHUFFLE: 'shuffle', KNOCK: 'knock', TAKE: 'take h', TAKE + 1: 'take u',
+         DRAW: 'draw h', DRAW + 1: 'draw u', THROW: 'throw h', THROW + 1: 'throw u',
+         TURNS: 'turns', END: 'no win', END + 1: 'sapphire wins', END + 2: 'opponent wins'}
+
+MAGIC = 'GINR'
+VERSION = 1
+HEADER = struct.Struct('<4sBxxxII')
+CHUNK = 1 << 16
+
+class Writer(object):
+    """ appends events to path in chunks of whole deals, a chunk is
+        written once it holds chunk events or more. Only events up to the
+        last END are ever written, the events of a deal still being
+        played (or given up by an exception) are dropped by close() """
+    def __init__(self, path, chunk = CHUNK):
+        end = 0
+        if os.path.exists(path):
+            for end, payload in scan(path):
+                pass
+        self.file = open(path, 'ab')
+        self.file.truncate(end)
+        self.chunk = chunk
+        self.buffer = array('B')
+        self.whole = 0
+        self.written = 0
+
+    def event(self, kind, value):
+        self.buffer.append(kind)
+        self.buffer.append(value)
+        if kind >= END:
+            self.whole = len(self.buffer)
+            if self.whole >= 2 * self.chunk:
+                self.flush()
+
+    def flush(self):
+        """ write the whole deals in the buffer as a chunk """
+        if not self.whole:
+            return
+        payload = self.buffer[:self.whole].tostring()
+        count = self.whole // 2
+        self.file.write(HEADER.pack(MAGIC, VERSION, count, zlib.crc32(payload) & 0xffffffff))
+        self.file.write(payload)
+        self.file.flush()
+        self.written += count
+        self.buffer = self.buffer[self.whole:]
+        self.whole = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def scan(path, start = 0):
+    """ generate (offset of the end, payload) for each whole chunk from
+        the chunk at offset start on """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            magic, version, count, crc = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('%s is not a version %i record file' % (path, VERSION))
+            payload = f.read(2 * count)
+            if len(payload) < 2 * count or zlib.crc32(payload) & 0xffffffff != crc:
+                return
+            yield f.tell(), payload
+
+def chunks(path):
+    """ generate the payload of each whole chunk of path as an array of
+        bytes, stopping at a chunk that was cut short """
+    for end, payload in scan(path):
+        yield array('B', payload)
+
+def events(path):
+    """ generate the (kind, value) events of path """
+    for payload in chunks(path):
+        for i in xrange(0, len(payload), 2):
+            yield payload[i], payload[i + 1]
+
+class Deal(object):
+    """ one recorded deal: the shuffle, the knock value, the moves as
+        (kind, card) in order, the number of turns, the winner (0 no one,
+        1 sapphire, 2 the opponent) and the score """
+    def __init__(self):
+        self.order = []
+        self.knock = 0
+        self.moves = []
+        self.turns = 0
+        self.winner = 0
+        self.score = 0
+
+    def __repr__(self):
+        return 'Deal(knock=%i, turns=%i, winner=%i, score=%i)' % (
+            self.knock, self.turns, self.winner, self.score)
+
+def deals(path):
+    """ generate the deals of path, one at a time """
+    deal = Deal()
+    for kind, value in events(path):
+        if kind == SHUFFLE:
+            deal.order.append(value)
+        elif kind == KNOCK:
+            deal.knock = value
+        elif kind < TURNS:
+            deal.moves.append((kind, value))
+        elif kind == TURNS:
+            deal.turns = value
+        else:
+            deal.winner = kind - END
+            deal.score = value
+            yield deal
+            deal = Deal()
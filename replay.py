@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+""" analysis of deals recorded by records.py
+
+    A Replay memory maps a record file and keeps an index of its deals as
+    numpy columns, one entry per deal:
+
+        offset, events  where the events of the deal are in the file
+        knock, turns, winner, score, up
+        hand_h, hand_u  the hands dealt as 52 bit masks
+        takes_h, takes_u, draws_h, draws_u
+                        how often each side took the discard (the times
+                        should_take_discard fired) or drew
+
+    The index is built a chunk at a time and saved next to the file
+    (path + '.npz'), when the file has grown only the new chunks are read.
+    Columns are plain arrays, so filters are boolean masks and group()
+    aggregates a value by a key under one:
+
+        r = replay.Replay('games.gin')
+        keys, counts, rates = r.group(r.deadwood('h'), r.winner == 1)
+        keys, counts, rates = r.group(r.knock, r.takes_h)
+        deck, discard, knock = r.deck(1234, turn = 6)
+"""
+
+import os
+import numpy as np
+import records
+import sapphire
+
+DTYPES = [('offset', np.int64), ('events', np.int32), ('knock', np.uint8),
+          ('turns', np.uint8), ('winner', np.uint8), ('score', np.uint8),
+          ('up', np.uint8), ('hand_h', np.uint64), ('hand_u', np.uint64),
+          ('takes_h', np.uint8), ('takes_u', np.uint8),
+          ('draws_h', np.uint8), ('draws_u', np.uint8)]
+BLOCK = 1 << 16
+
+def index_chunk(payload, base):
+    """ the columns of the deals in one chunk, base is the offset of the
+        payload in the file. Chunks hold whole deals and every deal starts
+        with its 52 SHUFFLE events """
+    events = np.frombuffer(payload, np.uint8).reshape(-1, 2)
+    kinds, values = events[:, 0], events[:, 1]
+    starts = np.flatnonzero(kinds == records.SHUFFLE)[::52]
+    ends = np.flatnonzero(kinds >= records.END)
+    dealt = values[starts[:, None] + np.arange(21)].astype(np.uint64)
+    bits = np.uint64(1) << dealt
+    columns = {'offset': base + 2 * starts, 'events': ends + 1 - starts,
+               'knock': values[starts + 52], 'turns': values[ends - 1],
+               'winner': kinds[ends] - records.END, 'score': values[ends],
+               'up': dealt[:, 20],
+               'hand_h': np.bitwise_or.reduce(bits[:, :10], axis = 1),
+               'hand_u': np.bitwise_or.reduce(bits[:, 10:20], axis = 1)}
+    for name, kind in (('takes', records.TAKE), ('draws', records.DRAW)):
+        for seat, location in enumerate('hu'):
+            hits = np.concatenate([[0], np.cumsum(kinds == kind + seat)])
+            columns[name + '_' + location] = hits[ends + 1] - hits[starts]
+    return dict([(name, columns[name].astype(dtype)) for name, dtype in DTYPES])
+
+def build_index(path, start = 0):
+    """ (columns, offset indexed to) for the whole chunks of path from
+        offset start on """
+    parts = dict([(name, []) for name, dtype in DTYPES])
+    end = start
+    for end, payload in records.scan(path, start):
+        for name, column in index_chunk(payload, end - len(payload)).items():
+            parts[name].append(column)
+    columns = dict([(name, np.concatenate(parts[name]) if parts[name] else np.zeros(0, dtype))
+                    for name, dtype in DTYPES])
+    return columns, end
+
+def load_index(path, cache = True):
+    """ the columns of path, read from the saved index and brought up to
+        date, saved again if anything was added """
+    saved = path + '.npz'
+    start = 0
+    old = None
+    if cache and os.path.exists(saved):
+        data = np.load(saved)
+        old = dict([(name, data[name]) for name, dtype in DTYPES])
+        start = int(data['size'])
+        if start > os.path.getsize(path):
+            old, start = None, 0
+    columns, size = build_index(path, start)
+    if old is not None:
+        columns = dict([(name, np.concatenate([old[name], columns[name]]))
+                        for name, dtype in DTYPES])
+    if cache and size != start:
+        with open(saved, 'wb') as f:
+            np.savez(f, size = size, **columns)
+    return columns
+
+def unpack(masks):
+    """ an n x 52 bool array of 52 bit masks """
+    return ((masks[:, None] >> np.arange(52, dtype = np.uint64)) & np.uint64(1)) == 1
+
+class Replay(object):
+    """ the deals of a record file, indexed by column """
+    def __init__(self, path, cache = True):
+        self.path = path
+        self.columns = load_index(path, cache)
+        if os.path.getsize(path):
+            self.data = np.memmap(path, np.uint8, mode = 'r')
+        else:
+            self.data = np.zeros(0, np.uint8)
+        self.derived = {}
+
+    def __len__(self):
+        return len(self.columns['offset'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def events(self, i):
+        """ the (kind, value) events of deal i, a view of the file """
+        offset = self.columns['offset'][i]
+        return self.data[offset:offset + 2 * self.columns['events'][i]].reshape(-1, 2)
+
+    def deadwood(self, location = 'h'):
+        """ the deadwood of the hands dealt to location, scored a block of
+            deals at a time """
+        name = 'deadwood_' + location
+        if name not in self.derived:
+            import batch
+            masks = self.columns['hand_' + location]
+            result = np.empty(len(masks), np.int16)
+            for i in range(0, len(masks), BLOCK):
+                result[i:i + BLOCK] = batch.evaluate(unpack(masks[i:i + BLOCK]))[0]
+            self.derived[name] = result
+        return self.derived[name]
+
+    def group(self, keys, values, where = None):
+        """ (distinct keys, count, mean of values) of the deals where is
+            true (all of them by default) grouped by keys """
+        keys = np.asarray(keys)
+        values = np.asarray(values, float)
+        if where is not None:
+            keys, values = keys[where], values[where]
+        distinct, inverse = np.unique(keys, return_inverse = True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights = values)
+        return distinct, counts, sums / np.maximum(counts, 1)
+
+    def deck(self, i, turn = 0):
+        """ (deck, discard, knock value) of deal i after turn moves (takes or
+            draws and their throws) were played """
+        events = self.events(i)
+        deck = sapphire.Deck()
+        discard, knock = sapphire.start_deal(deck, [int(c) for c in events[:52, 1]])
+        played = 0
+        for kind, value in events[53:]:
+            if played >= turn or kind >= records.TURNS:
+                break
+            card = deck.cards[value]
+            if kind < records.THROW:
+                deck.move(card, 'hu'[(kind - records.TAKE) % 2])
+            else:
+                deck.move(card, 'd')
+                discard = card
+                played += 1
+        return deck, discard, knock
+
+    def summary(self):
+        n = len(self)
+        print 'deals: %i' % n
+        if not n:
+            return
+        for winner, name in enumerate(['no one', 'sapphire', 'opponent']):
+            hit = self.columns['winner'] == winner
+            print '%-10s %6.1f%%  mean score %5.1f' % (
+                name, 100.0 * hit.mean(), self.columns['score'][hit].mean() if hit.any() else 0)
+        keys, counts, rates = self.group(self.columns['knock'], self.columns['takes_h'])
+        for k, c, r in zip(keys, counts, rates):
+            print 'knock %2i deals %8i takes per deal %5.2f' % (k, c, r)
+
+if __name__ == "__main__":
+    import sys
+    Replay(sys.argv[1]).summary()
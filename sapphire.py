@@ -3,41 +3,137 @@
 import random
 import time
 from itertools import *
-
-class Card(object):
-    """ playing card
-        location: p = pick pile, h = sapphire's hand, g = sapphire's unknown,
-        u = opponents uknown hand, k = opponents known hand, d = discards """
-    def __init__(self, rank, suit, position):
-        self.rank = rank
-        self.suit = suit
-        self.position = position
-        self.row = 0
-        self.col = 0
-        self.location = 'p'
-
-    def __repr__(self):
-        return '%s%s' % (self.rank, self.suit)
-
-def make_deck(shuffle = False):
+from masks import *
+from cards import CARDS, GRID
+from deadwood import arrangement, ranked
+from tables import RUNS, RUN_MASKS, RUN_HITS
+from handstate import HandState
+import instrument
+import infer
+import endgame
+import records
+
+# sapphire plays the rest of a deal with the endgame solver once this many
+# cards or fewer are left in the pick pile, 0 never does
+ENDGAME_CARDS = 0
+
+# Zobrist keys of a card in a location, the key of a deck is the xor of the
+# keys of where each card is so a move changes it by two xors
+LOCATIONS = 'phgukd'
+_zobrist = random.Random(4052)
+KEYS = dict([(loc, [_zobrist.getrandbits(64) for i in range(52)]) for loc in LOCATIONS])
+PILE_KEY = reduce(lambda a, b: a ^ b, KEYS['p'])
+
+class Deck(list):
+    """ the 4 x 13 grid of cards, rows SCHD and columns A..K, and the state
+        of a game: where each card is and its position in the shuffle
+        (lists indexed by card.index), a 52 bit mask of the cards in each
+        location, a HandState for each of the two hands, the cards each
+        hand took from the discards (and still holds) and the cards in
+        order of position, with the Zobrist key of where the cards are
+        (endgame.py keys its transposition table with it). The cards
+        themselves are the shared ones of cards.py. Moves made with
+        apply() go on an undo log and undo() takes them back, so a search
+        plays ahead on the one deck instead of copies of it. rng is
+        anything with randrange, random by default, the same deck is
+        reshuffled in place for every deal.
+        locations: p = pick pile, h = sapphire's hand, g = sapphire's
+        unknown, u = opponents uknown hand, k = opponents known hand,
+        d = discards """
+    def __init__(self, rng = None):
+        super(Deck, self).__init__([list(row) for row in GRID])
+        self.rng = rng or random
+        self.masks = {'p': FULL}
+        self.hands = {'h': HandState(), 'u': HandState()}
+        self.taken = {'h': 0, 'u': 0}
+        self.samplers = {}
+        self.cards = list(CARDS)
+        self.order = list(CARDS)
+        self.locations = ['p'] * 52
+        self.positions = range(52)
+        self.key = PILE_KEY
+        self.log = []
+
+    def location(self, card):
+        return self.locations[card.index]
+
+    def position(self, card):
+        return self.positions[card.index]
+
+    def move(self, card, location):
+        """ put card in location, updating the masks and hands """
+        old = self.locations[card.index]
+        self.locations[card.index] = location
+        self.key ^= KEYS[old][card.index] ^ KEYS[location][card.index]
+        masks = self.masks
+        masks[old] &= ~card.bit
+        masks[location] = masks.get(location, 0) | card.bit
+        if old in self.hands:
+            self.hands[old].remove(card.bit)
+            self.taken[old] &= ~card.bit
+        if location in self.hands:
+            self.hands[location].add(card.bit)
+            if old == 'd':
+                self.taken[location] |= card.bit
+
+    def apply(self, move):
+        """ make a move, (card, location), that undo() can take back """
+        card, location = move
+        old = self.locations[card.index]
+        taken = self.taken
+        self.log.append((card, old, taken.get(old), taken.get(location)))
+        self.move(card, location)
+
+    def undo(self, count = 1):
+        """ take back the last count moves made with apply() """
+        taken = self.taken
+        for i in range(count):
+            card, old, was, had = self.log.pop()
+            location = self.locations[card.index]
+            self.move(card, old)
+            if was is not None:
+                taken[old] = was
+            if had is not None:
+                taken[location] = had
+
+    def shuffle(self, order = None):
+        """ put every card back in the pick pile and give each a new
+            random position, or replay order, a list from record() """
+        perm = self.positions
+        if order is None:
+            rng = self.rng
+            for i in range(52):
+                perm[i] = i
+            for i in range(52):
+                j = rng.randrange(i,52)
+                perm[i], perm[j] = perm[j], perm[i]
+        else:
+            for pos, idx in enumerate(order):
+                perm[idx] = pos
+        for idx, card in enumerate(CARDS):
+            self.order[perm[idx]] = card
+        self.locations[:] = ['p'] * 52
+        self.masks.clear()
+        self.masks['p'] = FULL
+        for state in self.hands.values():
+            state.clear()
+        for location in self.taken:
+            self.taken[location] = 0
+        self.samplers.clear()
+        self.key = PILE_KEY
+        del self.log[:]
+
+    def record(self):
+        """ the shuffle as the list of card indices (row * 13 + col) in
+            position order, deck.shuffle(order) deals the same cards again """
+        return [c.index for c in self.order]
+
+def make_deck(shuffle = False, rng = None):
     """ create a deck of cards, if shuffle = True, then make_deck   
-        the position attribute a random number between 0 and 51 """
-    deck = []
+        each card a random position between 0 and 51 """
+    deck = Deck(rng)
     if shuffle:
-        order = range(52)
-        for i in range(52):
-            j = random.randrange(i,52)
-            order[i], order[j] = order[j], order[i]
-    for i, suit in enumerate('SCHD'):
-        row = []
-        for j, rank in enumerate('A23456789TJQK'):
-            idx = i * 13 + j
-            pos = order[idx] if shuffle else idx
-            card = Card(rank, suit, pos)
-            card.row = i
-            card.col = j
-            row.append(card)
-        deck.append(row) 
+        deck.shuffle()
     return deck   
 
 def set_locations(deck, strng, location):
@@ -48,18 +144,36 @@ def set_locations(deck, strng, location):
     for c in t:
         r = ranks.index(c[0].upper())
         s = suits.index(c[1].upper())
-        deck[s][r].location = location
+        deck.move(deck[s][r], location)
 
 def show_locations(deck, location):
     """ show the cards for a particular location, eg. hand, discards, etc. """
-    seq = [c for row in deck for c in row if c.location == location]
-    for c in seq:
+    for c in get_location(deck, location):
         print c.rank+c.suit + ' ',
     print    
 
+def location_mask(deck, location):
+    """ 52 bit mask of the cards in location """
+    return deck.masks.get(location, 0)
+
+def hand_state(deck, location):
+    """ the HandState of location, kept up to date by the deck for the two
+        hands and built from the mask for any other location """
+    if location in deck.hands:
+        return deck.hands[location]
+    return HandState(location_mask(deck, location))
+
+def cards_mask(seq):
+    """ 52 bit mask of a list of cards """
+    mask = 0
+    for c in seq:
+        mask |= c.bit
+    return mask
+
 def get_location(deck, location):
     """ the subset of the deck with in location """
-    return [c for row in deck for c in row if c.location == location]   
+    cards = deck.cards
+    return [cards[i] for i in iter_bits(location_mask(deck, location))]
 
 def get_card(deck, rank, suit):
     """ utitlity function to return a card object given it's ranks and suit """
@@ -78,20 +192,18 @@ def get_adjacent_card(deck, card, offset):
 def get_coord(deck, position):
     """ return the coordinates in the deck for a position
         in a  shuffled deck """
-    for i, row in enumerate(deck):
-        for j, card in enumerate(row):
-            if card.position == position:
-                return i, j
+    card = deck.order[position]
+    return card.row, card.col
 
 def card_count(deck, location):
     """ number of cards in location """
-    return len([c for row in deck for c in row if c.location == location])                    
+    return popcount(location_mask(deck, location))
 
 def display(deck, location):
-    cards = sorted([card for row in deck for card in row], key = lambda x : (x.location, x.suit, x.col))
-    cards = [c for c in cards if c.location == location]
+    cards = sorted([card for row in deck for card in row], key = lambda x : (deck.location(x), x.suit, x.col))
+    cards = [c for c in cards if deck.location(c) == location]
     for card in cards:
-        print 'Card: %s%s Pos: %2i Loc: %s Col: %2i' % (card.rank, card.suit, card.position, card.location, card.col)
+        print 'Card: %s%s Pos: %2i Loc: %s Col: %2i' % (card.rank, card.suit, deck.position(card), deck.location(card), card.col)
     print    
 
 def show_grid(deck):
@@ -101,7 +213,7 @@ def show_grid(deck):
     for idx, row in enumerate(deck):
         print 'SCHD'[idx], ': ',
         for card in row:
-            print card.location, ' ',
+            print deck.location(card), ' ',
         print
     print    
 
@@ -109,30 +221,19 @@ def runs(deck, suit, location):
     """ creat a list of lists of runs for each suit """
     idx = 'SCHD'.index(suit)
     cards = deck[idx]
-    # xs is list of 0s and 1s denoting the prescence of abscence of the card
-    # in the location
-    xs = [(lambda x: 1 if x.location == location else 0)(x) for x in cards]
+    # xs is the 13 bit pattern of the ranks of the suit in the location
+    xs = suit_ranks(location_mask(deck, location), idx)
     result = []
-    for n in range(2,6):
-        size =  len(xs)
-        run_length = []
-        for i in range(size):
-            m = min(i + n, size)
-            run_length.append(sum(xs[i:m]))
-        for j, x in enumerate(run_length):
-            run = []
-            if x == n:
-                for k in range(n):
-                    run.append(cards[j+k]) 
-            if run:        
-                result.append(run)  
+    for j, n in RUNS[xs]:
+        result.append(cards[j:j+n])
     return result    
 
 def sets(deck, location):
-    cards = get_location(deck, location)
+    mask = location_mask(deck, location)
+    cards = deck.cards
     result = []
-    for i in range(14):
-        s = [c for c in cards if c.col == i]
+    for column in RANK_COLUMN:
+        s = [cards[i] for i in iter_bits(mask & column)]
         if s:
             result.append(s)
     return result            
@@ -148,25 +249,21 @@ def points(seq):
 
 def conflict(r, s):
     """ True of any of the cards in r are also in s """
-    return any([(c in s) for c in r])  
+    return bool(cards_mask(r) & cards_mask(s))
 
 def no_conflicts(seq):
-    n = len(seq)
-    if n <= 1:
-        return True        
-    for i in range(n):
-        for j in range(i+1,n):
-            if conflict(seq[i],seq[j]):
-                return False
-    return True
+    return disjoint(map(cards_mask, seq))
         
 def remove_conflicts(seq):
     if not seq: 
         return []
     clean = [seq.pop(0)]
+    used = cards_mask(clean[0])
     for g in seq:
-        if not any([conflict(g,h) for h in clean]):
+        m = cards_mask(g)
+        if not used & m:
             clean.append(g)
+            used |= m
     return clean    
 
 def flatten(seq):
@@ -183,36 +280,36 @@ def meld_count(seq):
     cs = sum([min(len(t),4) for t in melds]) 
     return cs  
 
-def possibilities(deck, location):
-    """ generate a list of ways to organize a hand (location)
-        only consider hands with the maximum number of melds
+def arrangements(hand):
+    """ generate a list of ways to organize a 52 bit hand, each a list of
+        masks, only consider hands with the maximum number of melds
         mmc, then add pairs and only accept hands with max 
         number of melds plus pairs """
-    cards = [c for row in deck for c in row if c.location == location]
-    allruns = flatten([runs(deck, s, location) for s in 'SCHD'])
-    r3 = [r for r in allruns if len(r) >= 3]
-    r2 = [r for r in allruns if len(r) == 2]
-    allsets = sets(deck, location)
-    s4 = [s for s in allsets if len(s) == 4]
+    allruns = []
+    for row in range(4):
+        allruns += [m << (13 * row) for m in RUN_MASKS[suit_ranks(hand, row)]]
+    r3 = [r for r in allruns if popcount(r) >= 3]
+    r2 = [r for r in allruns if popcount(r) == 2]
+    allsets = [hand & column for column in RANK_COLUMN if hand & column]
+    s4 = [s for s in allsets if popcount(s) == 4]
     # if there is a set of 4 add in the subsets of lenght 3
-    s4 = s4 + flatten([map(list,(combinations(s,3))) for s in s4])
-    s3 = [s for s in allsets if len(s) == 3]
+    s4 = s4 + [s & ~(1 << i) for s in s4 for i in iter_bits(s)]
+    s3 = [s for s in allsets if popcount(s) == 3]
     s3 = s3 + s4
-    s2 = [s for s in allsets if len(s) == 2]
+    s2 = [s for s in allsets if popcount(s) == 2]
 
     # create a list of combinations of set and run melds taken
-    # 1,2, and 3 at a time
+    # 1,2, and 3 at a time, eliminating those with melds that share cards
     p = [[]]
     for i in range(1,4):
-        p += [list(e) for e in combinations(r3 + s3,i)] 
-
-    # eliminated lists that contain melds that share cards     
-    p = [e for e in p if no_conflicts(e)]
+        p += [list(e) for e in combinations(r3 + s3, i) if disjoint(e)]
 
     # calculate the maximum number of melds and eliminate
     # all the hands that have less
     mmc = max([len(e) for e in p])
     p = [e for e in p if len(e) == mmc]
+    if instrument.enabled:
+        instrument.count('arrangements.p', len(p), hand)
 
     # calculate the maximum number of pairs that can be added
     # to a hand with mmc melds of at least 3 cards each. And then
@@ -220,164 +317,219 @@ def possibilities(deck, location):
     q = [[]]
     max_pairs = int((11 - mmc * 3) / 2) + 1 
     for i in range(1,max_pairs):
-        q += [list(e) for e in combinations(r2 + s2,i)]
-    q = [e for e in q if no_conflicts(e)] 
+        q += [list(e) for e in combinations(r2 + s2, i) if disjoint(e)]
+    if instrument.enabled:
+        instrument.count('arrangements.q', len(q), hand)
 
     # consider adding the pairs to the melds and then eliminated
     # pairs that use cards from melds
-    q = [e + f for e in p for f in q]
-    q = map(remove_conflicts, q)
-    mmd = max([len(e) for e in q])
-    q = [e for e in q if len(e) == mmd]
+    full = []
+    for e in p:
+        used = sum(e)
+        full += [e + [f for f in pairs if not f & used] for pairs in q]
+    mmd = max([len(e) for e in full])
+    full = [e for e in full if len(e) == mmd]
 
     # fill the rest of the hand with single cards
-    for x in q:
-        for y in cards:
-            if not y in flatten(x):
-                x.append([y])
-    return uniqify(q)
+    result = set()
+    for x in full:
+        rest = hand & ~sum(x)
+        result.add(frozenset(x + [1 << i for i in iter_bits(rest)]))
+    return sorted([sorted(x) for x in result])
+
+def possibilities(deck, location):
+    """ the arrangements of a location as a frozenset of frozensets of cards """
+    cards = deck.cards
+    hand = location_mask(deck, location)
+    return uniqify([[[cards[i] for i in iter_bits(m)] for m in a]
+                    for a in arrangements(hand)])
+
+def ranked_hands(deck, location, k = None):
+    """ generate the arrangements of location as lists of cards, least
+        deadwood first and at most k of them, each one found as it is
+        asked for """
+    cards = deck.cards
+    for pts, groups in ranked(location_mask(deck, location), k):
+        yield [[cards[i] for i in iter_bits(m)] for m in groups]
+
+def run_hits(index, opp):
+    """ runs of 3 through card index (row * 13 + col) whose other cards
+        are all in the mask opp """
+    row, col = divmod(index, 13)
+    return RUN_HITS[suit_ranks(opp, row)][col]
+
+def card_wildness(index, known, opp):
+    """ wildness of card index given the masks of sapphire's hand and the
+        discards (known) and of the cards the opponent could hold (opp) """
+    combos = [3,1,0,0]
+    # subtract 1 since the card is in sapphires hand
+    r = popcount(known & RANK_COLUMN[index % 13]) - 1
+    return combos[r] + run_hits(index, opp)
 
 def possible_runs(deck, card):
     """ to calculate wildness from sapphires perspective ONLY """
-    opp = get_location(deck, 'u') + get_location(deck, 'p') + [card]
-    hits = 0
-    cu = get_adjacent_card(deck, card, 1)
-    cuu = get_adjacent_card(deck, card, 2)
-    cd = get_adjacent_card(deck, card, -1)
-    cdd = get_adjacent_card(deck, card, -2)
-    isin = [c in opp for c in [cdd, cd, card, cu, cuu]]
-    for i in range(3):
-        if all(isin[i:i + 3]):
-            hits += 1
-    return hits
+    opp = location_mask(deck, 'u') | location_mask(deck, 'p')
+    return run_hits(card.row * 13 + card.col, opp)
 
 def wildness(deck, card):
     """ how many pairs of cards could be in the opponents hand
         that the card would make into a meld -- sapphires perspective
         ONLY """
-    combos = [3,1,0,0]
-    known = get_location(deck, 'h') + get_location(deck, 'd')
-
-    # subtract 1 since the card is in sapphires hand
-    r = len([c.rank for c in known if c.rank == card.rank]) - 1
-    hits = combos[r] + possible_runs(deck, card)
-    return hits
-
-def best_hand(hands):
-    min_points = 110
-    for hand in hands:
-        p = points(hand)
-        if p < min_points:
-            min_points = p
-            h = hand
-    return h
+    known = location_mask(deck, 'h') | location_mask(deck, 'd')
+    opp = location_mask(deck, 'u') | location_mask(deck, 'p')
+    return card_wildness(card.row * 13 + card.col, known, opp)
+
+def evaluate_discards(deck, location):
+    """ for each card of location (an 11 card hand) the deadwood, the most
+        melded cards and the wildness of the card if it is thrown, as a
+        list of (card, deadwood, melded, wildness) """
+    state = hand_state(deck, location)
+    known = location_mask(deck, 'h') | location_mask(deck, 'd')
+    opp = location_mask(deck, 'u') | location_mask(deck, 'p')
+    cards = deck.cards
+    result = []
+    for card, pts, melded in state.each_removed():
+        i = card.bit_length() - 1
+        result.append((cards[i], pts, melded, card_wildness(i, known, opp)))
+    return result
+
+def best_hand(deck, location):
+    """ the arrangement of location with the least deadwood: melds, then
+        pairs, then single cards """
+    cards = deck.cards
+    return [[cards[i] for i in iter_bits(m)]
+            for m in arrangement(location_mask(deck, location))]
+
+def hand_points(deck, location):
+    """ deadwood points of location after its best arrangement """
+    return hand_state(deck, location).deadwood()
+
+def can_knock(deck, location, limit):
+    """ whether location has limit or fewer points of deadwood, the
+        search stops as soon as the answer is known """
+    return hand_state(deck, location).can_knock(limit)
 
 def show_orgs(xs):
-    n = len(xs)
-    print 'ARRANGEMENTS : ',n
+    """ print arrangements, a collection or a generator such as
+        ranked_hands() """
     for j in range(25): print '-',
     print
+    n = 0
     for o in xs:
+        n += 1
         for arr in sorted(o, key = lambda x: len(x), reverse = True):
             for a in sorted(arr):
                 print a.rank + a.suit,
             print ' | ',  
         print '\nPOINTS:%2i MELD COUNT:%2i ' % (points(o), meld_count(o))
         print                             
+    print 'ARRANGEMENTS : ',n
 
 def should_take_discard(deck, location, discard):
-    old_poss = possibilities(deck, location)
-    max_meld_count = max(map(meld_count, old_poss))
-    discard.location = location
-    new_poss = possibilities(deck, location)
-    new_max_meld_count = max(map(meld_count, new_poss))
-    discard.location = 'd'
-    return True if new_max_meld_count > max_meld_count else False
+    """ take the discard if it lets more cards be melded """
+    state = hand_state(deck, location)
+    return True if state.if_added(discard.bit)[1] > state.melded() else False
 
 def pick_from_deck(deck):
-    idx = 52 - card_count(deck, 'p')
-    row, col = get_coord(deck, idx)
-    return deck[row][col]  
-
-def sapphire_throw(deck, location):
-    cards = [c for row in deck for c in row if c.location == location]
-    poss = possibilities(deck, location)
-    min_points = 110
-    for h in poss:
-        p = points(h)
-        if p < min_points:
-            min_points = p
-            hand = h 
-    throws = [s for s in hand if len(s) < 2]
-    if not throws:           
-        throws = [s for s in hand if len(s) < 3]
-    if not throws:    
-        throws = [s for s in hand]
-    throws = flatten(throws)
-    min_wild = 7
-    for c in throws:
-        w = wildness(deck, c)
-        if w < min_wild:
-            min_wild = w
-            card = c
-    return card  
+    return deck.order[52 - card_count(deck, 'p')]
+
+def sapphire_throw(deck, location, budget_ms = 5):
+    """ the card leaving the least deadwood, as choose_throw, and among
+        those the one the sampled opponent hands would take least often,
+        then the highest rank. Weighing our deadwood against the deadwood
+        the throw saves the opponent did worse however small the weight,
+        so sampling only breaks the ties """
+    options = evaluate_discards(deck, location)
+    least = min([pts for c, pts, melded, w in options])
+    throws = [x for x in options if x[1] == least]
+    if len(throws) == 1:
+        return throws[0][0]
+    risks = infer.sampler(deck, location).risks([x[0].bit for x in throws], budget_ms)
+    return min(throws, key = lambda x: (risks[x[0].bit][0], -x[0].col))[0]
           
 def choose_throw(deck, location):
-    cards = [c for row in deck for c in row if c.location == location]
-    poss = possibilities(deck, location)
-    min_points = 110
-    for h in poss:
-        p = points(h)
-        if p < min_points:
-            min_points = p
-            hand = h  
-    throws = [s for s in hand if len(s) < 2]
-    if not throws:           
-        throws = [s for s in hand if len(s) < 3]
-    if not throws:    
-        throws = [s for s in hand]
-    throws = flatten(throws) 
-    max_points = -1
-    for c in throws:
-        p = c.col
-        if p > max_points:
-            max_points = p
-            card = c
-    return card  
-
-def take_turn(deck, location, discard, knock_value):
-    poss = possibilities(deck, location)
-    min_points = points(best_hand(poss))
-    # throw_func = sapphire_throw if location == 'h' else choose_throw
-    throw_func = choose_throw
-    if min_points <= knock_value:
+    """ the card leaving the least deadwood, the highest rank on ties """
+    options = evaluate_discards(deck, location)
+    return min(options, key = lambda x: (x[1], -x[0].col))[0]
+
+class Strategy(object):
+    """ the decisions of one side of a deal, the rules sapphire has always
+        played by. Subclass and override to play by others (see
+        strategy.py): whether to take the discard, which card to throw and
+        whether to knock once the hand is within the knock value """
+    name = 'default'
+
+    def take_discard(self, deck, location, discard):
+        return should_take_discard(deck, location, discard)
+
+    def throw(self, deck, location):
+        return choose_throw(deck, location)
+
+    def knock(self, deck, location, knock_value):
+        return True
+
+DEFAULT = Strategy()
+
+def take_turn(deck, location, discard, knock_value, turns = 0, sink = None,
+              strategy = None):
+    strategy = strategy or DEFAULT
+    if can_knock(deck, location, knock_value) and strategy.knock(deck, location, knock_value):
         return None, False        
-    if should_take_discard(deck, location, discard):
-        discard.location = location
+    move = None
+    if location == 'h' and card_count(deck, 'p') <= ENDGAME_CARDS:
+        move = endgame.solve(deck, location, discard, knock_value, turns)
+    if move is None:
+        move = strategy.take_discard(deck, location, discard), None
+    take, disc = move
+    seat = 0 if location == 'h' else 1
+    if take:
+        deck.move(discard, location)
+        if sink: sink(records.TAKE + seat, discard.row * 13 + discard.col)
     else:
         pick = pick_from_deck(deck)
-        pick.location = location
-    disc = throw_func(deck, location)
-    disc.location = 'd'        
-    g = False if points(best_hand(possibilities(deck,location))) <= knock_value else True
-    return disc, g
-
-def deal():
-    deck = make_deck(shuffle = True)
-    sapphire_turn = True
-    game = True
-    cards_left = card_count(deck,'p')
+        deck.move(pick, location)
+        if sink: sink(records.DRAW + seat, pick.row * 13 + pick.col)
+    if disc is None:
+        disc = strategy.throw(deck, location)
+    deck.move(disc, 'd')
+    if sink: sink(records.THROW + seat, disc.row * 13 + disc.col)
+    if can_knock(deck, location, knock_value):
+        return disc, not strategy.knock(deck, location, knock_value)
+    return disc, True
+
+def start_deal(deck, order = None):
+    """ shuffle deck (or replay order) and deal both hands and the up
+        card, returns the up card and the knock value """
+    deck.shuffle(order)
     for pos in range(21):
-        row, col = get_coord(deck, pos)
+        card = deck.order[pos]
         if pos < 10:
-            deck[row][col].location = 'h'
+            deck.move(card, 'h')
         elif pos < 20:
-            deck[row][col].location = 'u'
+            deck.move(card, 'u')
         else:
-            discard = deck[row][col]
-            discard.location = 'd' 
-            knock_value = min(deck[row][col].col + 1,10)
+            discard = card
+            deck.move(discard, 'd')
+            knock_value = min(card.col + 1,10)
             if knock_value == 1: knock_value = 0                    
+    return discard, knock_value
+
+def deal(deck = None, order = None, sink = None, players = None):
+    """ play one deal, reshuffling deck if given, order replays a shuffle
+        from deck.record(), sink(kind, value) is called with the events of
+        records.py, players are the Strategy of sapphire and of the
+        opponent """
+    sapphire_player, opponent_player = players or (DEFAULT, DEFAULT)
+    if deck is None:
+        deck = Deck()
+    discard, knock_value = start_deal(deck, order)
+    if sink:
+        for idx in deck.record():
+            sink(records.SHUFFLE, idx)
+        sink(records.KNOCK, knock_value)
+    sapphire_turn = True
+    game = True
+    cards_left = card_count(deck,'p')
     sapphire_wins = False
     score = 0
     turns = 0
@@ -385,47 +537,106 @@ def deal():
         turns += 1
         # print '.',
         if sapphire_turn:
-            discard, game = take_turn(deck, 'h', discard, knock_value)
+            discard, game = take_turn(deck, 'h', discard, knock_value, turns, sink,
+                                      sapphire_player)
             if not game:
                 sapphire_wins = True
-                score = points(best_hand(possibilities(deck,'u')))
+                score = hand_points(deck, 'u')
         else:
-            discard, game = take_turn(deck, 'u', discard, knock_value)
+            discard, game = take_turn(deck, 'u', discard, knock_value, turns, sink,
+                                      opponent_player)
             if not game:
-                score = points(best_hand(possibilities(deck,'h'))) 
+                score = hand_points(deck, 'h')
         sapphire_turn = not sapphire_turn
         cards_left = card_count(deck, 'p')
     # if sapphire_wins:
     #     print score 
     # else:
     #     print -score        
-    if cards_left > 2:    
-        return sapphire_wins, score
+    if game or cards_left <= 2:
+        sapphire_wins, score, winner = False, 0, 0
     else:
-        return False, 0    
+        winner = 1 if sapphire_wins else 2
+    if sink:
+        sink(records.TURNS, turns)
+        sink(records.END + winner, score)
+    return sapphire_wins, score
     
-def play():
+def match(target = 200, sink = None, players = None):
+    """ play deals until someone reaches target, returns sapphire's and
+        the opponent's scores and the number of deals """
+    deck = Deck()
     s_score = 0
     o_score = 0
-    while max(s_score, o_score) < 200:
-        win, s = deal()
+    deals = 0
+    while max(s_score, o_score) < target:
+        win, s = deal(deck, sink = sink, players = players)
+        deals += 1
         if win:
             s_score += s
         else:
             o_score += s    
+    return s_score, o_score, deals
+
+def play():
+    s_score, o_score, deals = match()
     print 'Sapphire: %3i Opponent %3i' % (s_score, o_score)
     return True if s_score > o_score else False  
 
-def test():
-    s = o = 0
-    for i in range(1000):
-        print i,
-        if play():
-            s += 1
-        else:
-            o += 1
-    print 'sappire wins: %4i opponent wins %4i' % (s,o)                
-    
-test()
-
-
+def check_deadwood(trials = 1000):
+    """ compare best_hand with the best of the old possibilities enumeration
+        on random hands, the solver must never be worse """
+    better = 0
+    for i in range(trials):
+        deck = make_deck(shuffle = True)
+        size = random.choice([10, 11])
+        for c in deck.order[:size]:
+            deck.move(c, 'h')
+        hand = best_hand(deck, 'h')
+        assert sorted(map(repr, flatten(hand))) == sorted(map(repr, get_location(deck, 'h')))
+        assert no_conflicts(hand)
+        old = min(map(points, possibilities(deck, 'h')))
+        new = points(hand)
+        assert new == hand_points(deck, 'h')
+        assert can_knock(deck, 'h', new) and not can_knock(deck, 'h', new - 1)
+        assert points(next(ranked_hands(deck, 'h'))) == new
+        assert new <= old, (get_location(deck, 'h'), new, old)
+        if new < old:
+            better += 1
+    print 'hands: %4i solver better: %4i' % (trials, better)
+
+def deck_state(deck):
+    """ everything apply() and undo() have to keep in step """
+    hands = dict([(loc, (h.deadwood(), h.melded())) for loc, h in deck.hands.items()])
+    masks = dict([(loc, m) for loc, m in deck.masks.items() if m])
+    return (list(deck.locations), masks, hands, dict(deck.taken), deck.key)
+
+def check_undo(trials = 200, depth = 40):
+    """ random moves made with apply() and taken back with undo() must
+        leave the deck as it was, and the key must only depend on where
+        the cards are """
+    for i in range(trials):
+        deck = make_deck(shuffle = True)
+        start_deal(deck)
+        before = deck_state(deck)
+        states = []
+        for j in range(depth):
+            states.append(deck_state(deck))
+            deck.apply((random.choice(CARDS), random.choice(LOCATIONS)))
+        key = 0
+        for c in CARDS:
+            key ^= KEYS[deck.location(c)][c.index]
+        assert key == deck.key
+        while states:
+            deck.undo()
+            assert deck_state(deck) == states.pop()
+        assert deck_state(deck) == before and not deck.log
+    print 'undo: %i trials of %i moves ok' % (trials, depth)
+
+def test(budget = 1000):
+    """ play matches until one side is clearly ahead, at most budget """
+    import sequential
+    sequential.run(play, sequential.SPRT(), budget).report()
+
+if __name__ == "__main__":
+    test()
@@ -1,39 +1,112 @@
 #!/usr/bin/env python
 
 import random 
+from collections import OrderedDict
 from itertools import permutations
+from cards import CARDS as SHARED
 
 class Card(object):
-    """playing card"""
-    def __init__(self, rank = 0, suit = ''):
-        self.rank = rank
-        self.suit = suit
-        self.wild_score = 6
-        self.in_meld = False
-
-    def valid(self):
-        if self.rank in range(1,14) and self.suit in ('schd'):
-            return True
-        else:
-            return False 
+    """a card of cards.py as this module counts: rank 1 to 13 and suit
+    's', 'c', 'h' or 'd'. There is one for each shared card, made at
+    import, so a game makes no cards of its own"""
+    __slots__ = ('card', 'rank', 'suit')
+
+    def __init__(self, card):
+        self.card = card
+        self.rank = card.col + 1
+        self.suit = card.suit.lower()
 
     def format(self):
-        if not self.valid(): return 'INVALID CARD'
-        if self.rank in range(10,14):
-            r = 'TJQK'[self.rank - 10]
-        elif self.rank == 1:
-            r = 'A'
-        else:
-            r = str(self.rank)
-        return r + self.suit.upper()
+        return repr(self.card)
+
+CARDS = tuple([Card(c) for c in SHARED])
+
+def card(rank, suit):
+    """ the card of rank 1 to 13 and suit 's', 'c', 'h' or 'd' """
+    return CARDS['schd'.index(suit) * 13 + rank - 1]
     
+def card_bit(rank, suit):
+    """ the bit of a card in a 52 bit mask, suits schd and ranks 1 to 13 """
+    return 1 << ('schd'.index(suit) * 13 + rank - 1)
+
+# the bits of the four cards of each rank
+RANK_BITS = [0] + [sum([card_bit(r, s) for s in 'schd']) for r in range(1, 14)]
+
 class Group(object):
-    """a set of cards"""
+    """a set of cards, kept in order and indexed by (rank, suit) and by a
+    52 bit mask so membership, add, remove and moves are O(1)"""
     def __init__(self, cards = None, grps = None):
-        if cards is None:
-            self.cards = []
-        else:
-            self.cards = cards 
+        self.clear()
+        if cards is not None:
+            self.cards = cards
+
+    def clear(self):
+        self.index = OrderedDict()
+        self.mask = 0
+
+    @property
+    def cards(self):
+        return self.index.values()
+
+    @cards.setter
+    def cards(self, cards):
+        self.clear()
+        for c in cards:
+            self.add(c)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index.values())
+
+    def __contains__(self, card):
+        """ card is a Card or a (rank, suit) pair """
+        rank, suit = card if isinstance(card, tuple) else (card.rank, card.suit)
+        if not (1 <= rank <= 13 and suit in ('s', 'c', 'h', 'd')):
+            return False
+        return bool(self.mask & card_bit(rank, suit))
+
+    def get(self, rank, suit):
+        return self.index.get((rank, suit))
+
+    def add(self, card):
+        self.index[(card.rank, card.suit)] = card
+        self.mask |= card_bit(card.rank, card.suit)
+
+    def remove(self, card):
+        """ take card (or the card of this group with its rank and suit)
+            out and return it """
+        c = self.index.pop((card.rank, card.suit))
+        self.mask &= ~card_bit(card.rank, card.suit)
+        return c
+
+    def pop(self):
+        """ take out the last card """
+        key, c = self.index.popitem()
+        self.mask &= ~card_bit(c.rank, c.suit)
+        return c
+
+    def move(self, card, grp):
+        """ move card from self to grp """
+        grp.add(self.remove(card))
+
+    def rank_count(self, rank):
+        """ number of cards of rank """
+        return bin(self.mask & RANK_BITS[rank]).count('1')
+
+    def __or__(self, other):
+        result = Group(self.cards)
+        for c in other:
+            if c not in result:
+                result.add(c)
+        return result
+
+    def __and__(self, other):
+        return Group([c for c in self if other.mask & card_bit(c.rank, c.suit)])
+
+    def __sub__(self, other):
+        return Group([c for c in self if not other.mask & card_bit(c.rank, c.suit)])
 
     def show(self, title = None):  
         if title: print title.upper() + ' : ' + str(len(self.cards))
@@ -55,30 +128,25 @@ class Group(object):
         for c in t:
             r = ranks.index(c[0].lower())
             s = c[1].lower()
-            t = Card(r,s)
-            self.cards.append(t)
+            self.add(card(r, s))
 
     def take_from(self, card_name, grp):
         """move cards from grp to self.cards"""
         ranks = '0a23456789tjqk'
         rs = (ranks.index(card_name[0].lower()), card_name[1].lower())
-        for card in grp.cards:
-            if (card.rank, card.suit) == rs:
-                c = card
-                break;
-        self.cards.append(c)
-        grp.cards.remove(c)
+        grp.move(grp.get(*rs), self)
 
 class Deck(Group):
     """a standard 52 card deck"""
     def __init__(self, shuffle = False):
         super(Deck, self).__init__()
-        self.cards = [Card(r,s) for s in 'schd' for r in range(1,14)]
+        cards = list(CARDS)
         if shuffle:
-            n = len(self.cards)
+            n = len(cards)
             for i in range(n - 1):
                 j = random.randrange(i,n)
-                self.cards[i], self.cards[j] = self.cards[j], self.cards[i]
+                cards[i], cards[j] = cards[j], cards[i]
+        self.cards = cards
                         
 class Hand(Group):
     """A gin rummy hand"""
@@ -102,81 +170,119 @@ class Hand(Group):
             print                     
 
     def run(self, suit, cards):
-        def runner(cs, rs):
-            if not cs:
-                return rs
-            else:
-                rs.append(cs[0])
-                if len(cs) > 1 and cs[1].rank - cs[0].rank == 1:
-                    runner(cs[1:], rs)
-            return rs
-        return runner(cards,[])    
+        """ the run at the start of cards, a list sorted by rank """
+        rs = cards[:1]
+        for prev, c in zip(cards, cards[1:]):
+            if c.rank - prev.rank != 1:
+                break
+            rs.append(c)
+        return rs
 
     def runs(self, suit):
+        """ the cards of suit split into runs of consecutive ranks, each
+            as long as it can be """
         cards = [c for c in self.cards if c.suit == suit]
         cards.sort(key = lambda x: x.rank)
-        def runs_iter(cs, rs):
-            if not cs:
-                return rs
-            else:
-                r = self.run(suit, cs)
-                n = len(r)
-                rs.append(r)
-                return runs_iter(cs[n:], rs)
-        return runs_iter(cards, []) 
+        rs = []
+        while cards:
+            r = self.run(suit, cards)
+            rs.append(r)
+            cards = cards[len(r):]
+        return rs
 
-    def points(self):
-        result = 100
-        for h in self.orgs: 
-            p = 0
-            for m in h:
-                if len(m) < 3:
-                    for  c in m:
-                        p += min(c.rank, 10)
-            result = min(result, p)
-        return result    
-
-    def possibilities(self):
+    def melds(self):
+        """ (melds, pairs): the runs and sets of 3 or more cards and of 2
+            cards, runs as long as they go and sets of all cards of a rank """
         allruns = self.runs('s') + self.runs('c') + self.runs('h') + self.runs('d')
-        r3 = [r for r in allruns if len(r) >= 3]
-        r2 = [r for r in allruns if len(r) == 2]
-        r1 = [r for r in allruns if len(r) == 1]
         allsets = []
         for i in range(14):
             s = [c for c in self.cards if c.rank == i + 1]
             if s:
                 allsets.append(s)
-        s3 = [s for s in allsets if len(s) >= 3]
-        s2 = [s for s in allsets if len(s) == 2]
-        s1 = [s for s in allsets if len(s) == 1]
-        p = [list(e) for e in permutations(r3 + s3)]
-        p =  map(remove_conflicts, p)
-        q = [list(e) for e in permutations(r2 + s2)]
-        q = [e + f for e in p for f in q]
-        q = map(remove_conflicts, q)
-        for x in q:
-            for y in self.cards:
-                if not y in flatten(x):
-                    x.append([y])
-        self.orgs = uniqify(q)
-        
+        melds = [g for g in allruns if len(g) >= 3] + [g for g in allsets if len(g) >= 3]
+        pairs = [g for g in allruns if len(g) == 2] + [g for g in allsets if len(g) == 2]
+        return melds, pairs
+
+    def masks(self, groups):
+        """ each group as a bit mask of the positions of its cards in the hand """
+        index = dict([(id(c), i) for i, c in enumerate(self.cards)])
+        return [sum([1 << index[id(c)] for c in g]) for g in groups]
+
+    def points(self):
+        """ least deadwood over every maximal choice of melds """
+        melds, pairs = self.melds()
+        masks = self.masks(melds)
+        pts = [min(c.rank, 10) for c in self.cards]
+        result = 100
+        for chosen in independent(masks):
+            used = 0
+            for i in chosen:
+                used |= masks[i]
+            result = min(result, sum([p for k, p in enumerate(pts) if not used >> k & 1]))
+        return result
+
+    def possibilities(self):
+        """ every arrangement of the hand: a maximal choice of disjoint
+            melds, then a maximal choice of disjoint pairs among the cards
+            left, then the rest as single cards """
+        melds, pairs = self.melds()
+        meld_masks = self.masks(melds)
+        pair_masks = self.masks(pairs)
+        orgs = set()
+        for chosen in independent(meld_masks):
+            used = 0
+            for i in chosen:
+                used |= meld_masks[i]
+            for paired in independent(pair_masks, used):
+                covered = used
+                for j in paired:
+                    covered |= pair_masks[j]
+                x = [melds[i] for i in chosen] + [pairs[j] for j in paired]
+                x += [[c] for k, c in enumerate(self.cards) if not covered >> k & 1]
+                orgs.add(uniqify(x))
+        self.orgs = frozenset(orgs)
 
 ############################################################################################
 
+def independent(masks, used = 0):
+    """ every maximal choice (as a list of indices) of masks that share no
+        bits with each other or with used. A choice on the stack is only
+        extended by masks after its last one, so each choice is seen once
+        and the work is bounded by the number of disjoint choices rather
+        than by the orders of the masks """
+    free = [i for i, m in enumerate(masks) if not m & used]
+    result = []
+    stack = [(0, used, [])]
+    while stack:
+        start, taken, chosen = stack.pop()
+        for k in range(start, len(free)):
+            i = free[k]
+            if not masks[i] & taken:
+                stack.append((k + 1, taken | masks[i], chosen + [i]))
+        if all([masks[i] & taken for i in free]):
+            result.append(chosen)
+    return result
+
+def cards_mask(cards):
+    mask = 0
+    for c in cards:
+        mask |= card_bit(c.rank, c.suit)
+    return mask
+
 def conflict(r, s):
-        con = False
-        for c in r:
-            if c in s:
-                con = True
-        return con    
+    """ True if r and s share a card """
+    return bool(cards_mask(r) & cards_mask(s))
 
 def remove_conflicts(grps):
     if not grps: 
         return []
     clean = [grps.pop(0)]
+    used = cards_mask(clean[0])
     for g in grps:
-        if not any([conflict(g,h) for h in clean ]):
+        m = cards_mask(g)
+        if not used & m:
             clean.append(g)
+            used |= m
     return clean    
 
 def flatten(ohand):
@@ -190,15 +296,12 @@ def meld_count(ohand):
     return sum([min(len(t),4) for t in ohand if len(t) >= 3])
 
 def possible_runs(card, opponent_known, unknown):
-    uk = Group(opponent_known.cards + unknown.cards)
+    """ runs of 3 through card whose other two cards could be with the
+        opponent (known to be there or unknown) """
     hits = 0
-    def in_u(c):
-        return c in uk
-    cu = (card.rank + 1,card.suit)
-    cuu = (card.rank + 2,card.suit)
-    cd = (card.rank - 1,card.suit)
-    cdd = (card.rank - 2,card.suit)
-    isin = map(in_u, [cdd, cd, uk.rank, cu, cuu])
+    isin = [(card.rank + k, card.suit) in opponent_known or
+            (card.rank + k, card.suit) in unknown for k in (-2, -1, 1, 2)]
+    isin.insert(2, True)
     for i in range(3):
         if all(isin[i:i + 3]):
             hits += 1
@@ -206,21 +309,25 @@ def possible_runs(card, opponent_known, unknown):
 
 def wildness(card, myhand, opponent_known, discards, unknown):
     combos = [3,1,0,0]
-    known = Group(myhand.cards + discards.cards)
-    r = len([c.rank for c in known.cards if c.rank == card.rank])
-    hits = combos[r] + possible_runs(card, opponent_known, unknown)
+    r = myhand.rank_count(card.rank) + discards.rank_count(card.rank)
+    hits = combos[min(r, 3)] + possible_runs(card, opponent_known, unknown)
     return hits
 
-def goodness(card, myhand, opponent_known, discards, unknown):
-    result = 0
+def melded(myhand):
+    """ mask of the cards that are in a meld in some arrangement """
+    mask = 0
     for h in myhand.orgs:
         for s in h:
-            if card in s and len(s) >= 3:
-                result = 1
-    return result          
+            if len(s) >= 3:
+                mask |= cards_mask(s)
+    return mask
+
+def goodness(card, myhand, opponent_known, discards, unknown):
+    return 1 if melded(myhand) & card_bit(card.rank, card.suit) else 0
 
 def throw(myhand, opponent_known, discards, unknown):  
-    candidates = [c for c in myhand.cards if goodness(c, myhand, opponent_known, discards, unknown) == 0]
+    in_melds = melded(myhand)
+    candidates = [c for c in myhand.cards if not in_melds & card_bit(c.rank, c.suit)]
     card_wildness = 6
     card = (0,'')
     for c in candidates:
@@ -237,13 +344,13 @@ def game_sim():
     deck = Deck(shuffle = True)
     hand = Hand()
     opponent = Hand()
-    discards = Group([deck.cards.pop()])
+    discards = Group([deck.pop()])
     for i in range(4):
         print
     for i in range(10):
-        hand.cards.append(deck.cards.pop())
+        hand.add(deck.pop())
     print
-    hand.cards.append(discards.cards.pop())
+    hand.add(discards.pop())
     hand.show(title = "sapphire's hand")
     opponent.show(title = "opponent's hand")
     deck.show(title = 'deck')
@@ -254,7 +361,56 @@ def game_sim():
     thwow_choice = throw(hand, opponent, discards, deck)
     print thwow_choice.format()
 
+def permuted_possibilities(hand):
+    """ the arrangements found the way Hand.possibilities used to, from
+        every order of the melds and of the pairs """
+    melds, pairs = hand.melds()
+    p = [list(e) for e in permutations(melds)]
+    p = map(remove_conflicts, p)
+    q = [list(e) for e in permutations(pairs)]
+    q = [e + f for e in p for f in q]
+    q = map(remove_conflicts, q)
+    for x in q:
+        for y in hand.cards:
+            if not y in flatten(x):
+                x.append([y])
+    return uniqify(q)
+
+WORST = ['as 2s 3s ac 2c 3c ah 2h 3h ad 2d',
+         'as 2s 3s 4s ac 2c 3c 4c ah 2h 3h',
+         '5s 6s 7s 5c 6c 7c 5h 6h 7h 5d 6d',
+         'as ac ah 2s 2c 3s 3d 4h 4d 5c 5h']
+
+def benchmark(trials = 1000, seed = 0):
+    """ time possibilities on the hands with the most overlapping melds
+        and on random hands, and the old search where it finishes """
+    import time
+    for text in WORST:
+        hand = Hand(text)
+        start = time.time()
+        hand.possibilities()
+        new = time.time() - start
+        start = time.time()
+        old = permuted_possibilities(hand)
+        elapsed = time.time() - start
+        assert len(old) == len(hand.orgs)
+        print '%s: %4i arrangements %8.2f ms (permutations %8.2f ms)' % (
+            text, len(hand.orgs), new * 1000, elapsed * 1000)
+    rng = random.Random(seed)
+    cards = Deck().cards
+    start = time.time()
+    for i in range(trials):
+        hand = Hand()
+        hand.cards = rng.sample(cards, rng.choice([10, 11]))
+        hand.possibilities()
+        hand.points()
+    print 'random hands: %8.3f ms per hand' % ((time.time() - start) / trials * 1000)
 
-game_sim()
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ['bench']:
+        benchmark()
+    else:
+        game_sim()
 
 
@@ -3,22 +3,13 @@
 import random
 import time
 from itertools import *
-
-class Card(object):
-    """ playing card rank=[0,12], suit=[0,3], position in deck """
-    def __init__(self, rank, suit):
-        self.rank = rank
-        self.suit = suit
-
-    def __repr__(self):
-        ranks = 'A23456789TJQK'
-        suits = 'SCHD'
-        return '%s%s' % (ranks[self.rank], suits[self.suit])
+from cards import CARDS
 
 class State(object):
-    """ Game state information and methods """
+    """ Game state information and methods, the cards are the shared
+        ones of cards.py: col is the rank 0 to 12 and row the suit 0 to 3 """
     def __init__(self, shuffle = False):
-        self.deck = [Card(r,s) for s in range(4) for r in range(13)]
+        self.deck = list(CARDS)
         self.sapphire = []
         self.opponent = []
         self.discard = []
@@ -37,11 +28,11 @@ class State(object):
             self.sapphire.append(self.deck.pop())    
             self.opponent.append(self.deck.pop())
         self.discard.append(self.deck.pop())
-        self.knock = min(self.discard[0].rank, 9)
+        self.knock = min(self.discard[0].col, 9)
         if self.knock > 0: self.knock += 1  
 
     def get_same_suit(group, suit):
-        cards = [c for c in group if c.suit == suit]
+        cards = [c for c in group if c.row == suit]
         return cards.sort()      
 
 def show_state(game):
@@ -65,8 +56,8 @@ def main():
 
 # def runs(group, suit):
 #     """ creat a list of lists of runs for each suit """
-#     cards = [c for c in group if c.suit == suit]
-#     card_ranks = [c.rank for c in cards]
+#     cards = [c for c in group if c.row == suit]
+#     card_ranks = [c.col for c in cards]
 
 #     # xs is list of 0s and 1s denoting the prescence of abscence of the card
 #     xs = [0] * 13
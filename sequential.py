@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+""" play until the result is clear
+
+    A fixed number of matches wastes most of them when one side is far
+    ahead. run() plays in batches and after each batch asks a sequential
+    test whether it can stop: Wald's sequential probability ratio test,
+    on the win rate (SPRT) or on the mean points of a deal or a duplicate
+    pair (MeanSPRT). With error rates alpha and beta the test stops at
+    the first batch where the log likelihood ratio leaves
+    (log(beta / (1 - alpha)), log((1 - beta) / alpha)), and the games
+    left in the budget are saved.
+
+    Games are played by mapping a function over argument tuples, with
+    map() by default or the map of any executor (multiprocessing.Pool or
+    concurrent.futures), so the function has to be picklable for those.
+
+        result = run(sapphire.play, SPRT(0.45, 0.55), budget = 1000)
+        result = run(tournament.play_seeded, SPRT(), executor = Pool(),
+                     jobs = [(s,) for s in tournament.match_seeds(1000)],
+                     value = won)
+        result.report()
+"""
+
+import math
+import sys
+
+H0, H1 = 'H0', 'H1'
+
+class SPRT(object):
+    """ win rate p0 (H0) against p1 (H1), outcomes are true for a win """
+    def __init__(self, p0 = 0.45, p1 = 0.55, alpha = 0.05, beta = 0.05):
+        self.p0 = p0
+        self.p1 = p1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.win = math.log(p1 / p0)
+        self.loss = math.log((1 - p1) / (1 - p0))
+        self.wins = 0
+        self.n = 0
+
+    def add(self, won):
+        self.n += 1
+        if won:
+            self.wins += 1
+
+    def llr(self):
+        return self.wins * self.win + (self.n - self.wins) * self.loss
+
+    def decision(self):
+        llr = self.llr()
+        if llr >= self.upper:
+            return H1
+        if llr <= self.lower:
+            return H0
+        return None
+
+    def describe(self):
+        return 'win rate %.3f after %i games (H0 p = %.2f, H1 p = %.2f)' % (
+            float(self.wins) / self.n if self.n else 0.0, self.n, self.p0, self.p1)
+
+class MeanSPRT(object):
+    """ mean -delta (H0) against +delta (H1) of normal outcomes such as
+        points per deal, the variance is estimated as games come in and
+        no decision is made before least games """
+    def __init__(self, delta = 1.0, alpha = 0.05, beta = 0.05, least = 30):
+        self.delta = delta
+        self.least = least
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.n = 0
+        self.total = 0.0
+        self.squares = 0.0
+
+    def add(self, value):
+        self.n += 1
+        self.total += value
+        self.squares += value * value
+
+    def variance(self):
+        if self.n < 2:
+            return float('inf')
+        mean = self.total / self.n
+        return max((self.squares - self.n * mean * mean) / (self.n - 1), 1e-9)
+
+    def llr(self):
+        return 2 * self.delta * self.total / self.variance()
+
+    def decision(self):
+        if self.n < self.least:
+            return None
+        llr = self.llr()
+        if llr >= self.upper:
+            return H1
+        if llr <= self.lower:
+            return H0
+        return None
+
+    def describe(self):
+        return 'mean %.2f after %i games (H0 %.2f, H1 %.2f)' % (
+            self.total / self.n if self.n else 0.0, self.n, -self.delta, self.delta)
+
+class Result(object):
+    def __init__(self, test, played, budget):
+        self.test = test
+        self.decision = test.decision()
+        self.played = played
+        self.budget = budget
+        self.saved = budget - played
+
+    def report(self):
+        verdict = {H1: 'H1 accepted', H0: 'H0 accepted', None: 'no decision'}[self.decision]
+        print '%s: %s' % (verdict, self.test.describe())
+        print 'games played: %i of %i, saved: %i (%.0f%%)' % (
+            self.played, self.budget, self.saved, 100.0 * self.saved / self.budget)
+
+def _call(job):
+    func, args = job
+    return func(*args)
+
+def won(result):
+    """ the outcome of a tournament.play_seeded result for SPRT """
+    seed, s_score, o_score, deals = result
+    return s_score > o_score
+
+def run(func, test, budget = 1000, batch = 50, executor = None, jobs = None,
+        value = None, progress = None):
+    """ play func(*args) for the argument tuples of jobs (budget times with
+        no arguments by default) a batch at a time until test decides,
+        value maps a result to the outcome test takes """
+    if jobs is None:
+        jobs = [()] * budget
+    budget = len(jobs)
+    mapper = executor.map if executor is not None else map
+    played = 0
+    for start in range(0, budget, batch):
+        results = mapper(_call, [(func, args) for args in jobs[start:start + batch]])
+        for r in results:
+            test.add(value(r) if value else r)
+            played += 1
+        if progress:
+            progress(played, test)
+        if test.decision() is not None:
+            break
+    return Result(test, played, budget)
+
+if __name__ == "__main__":
+    import tournament
+    from multiprocessing import Pool
+    budget = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    pool = Pool()
+    run(tournament.play_seeded, SPRT(), executor = pool, value = won,
+        jobs = [(s,) for s in tournament.match_seeds(budget)]).report()
+    pool.close()
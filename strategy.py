@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+""" strategies and a duplicate deal harness to compare them
+
+    A strategy is a sapphire.Strategy: take_discard(deck, location,
+    discard), throw(deck, location) and knock(deck, location, knock_value).
+    head_to_head() plays every shuffle twice, once with each strategy in
+    sapphire's seat (who moves first), replaying the shuffle with
+    deck.shuffle(order). The luck of the cards is the same for both
+    sides of a pair and cancels in the difference, so the points a
+    strategy wins per pair vary far less than over single deals.
+
+        python strategy.py 1000 sampled default
+"""
+
+import math
+import random
+import sys
+import parallel
+import sapphire
+from sapphire import Strategy, DEFAULT
+
+class SampledThrow(Strategy):
+    """ throw by sapphire_throw: least deadwood, then the card sampled
+        opponent hands are least likely to want """
+    name = 'sampled'
+
+    def __init__(self, budget_ms = None):
+        self.budget_ms = budget_ms
+
+    def throw(self, deck, location):
+        return sapphire.sapphire_throw(deck, location, self.budget_ms)
+
+class LeastDeadwood(Strategy):
+    """ take the discard whenever the best throw after it leaves less
+        deadwood than the hand has now """
+    name = 'deadwood'
+
+    def take_discard(self, deck, location, discard):
+        now = sapphire.hand_points(deck, location)
+        deck.apply((discard, location))
+        after = min([pts for card, pts, melded in deck.hands[location].each_removed()
+                     if card != discard.bit])
+        deck.undo()
+        return after < now
+
+STRATEGIES = dict([(s.name, s) for s in [DEFAULT, SampledThrow(), LeastDeadwood()]])
+
+def shuffles(deals, seed = 0):
+    """ deals shuffles as card orders, from one seed """
+    deck = sapphire.Deck(random.Random(seed))
+    orders = []
+    for i in range(deals):
+        deck.shuffle()
+        orders.append(deck.record())
+    return orders
+
+def points(result):
+    """ the points of a deal for sapphire's seat, negative when the
+        opponent won """
+    sapphire_wins, score = result
+    return score if sapphire_wins else -score
+
+def play_pair(args):
+    """ (a's points with a first, a's points with b first) of a shuffle """
+    a, b, order = args
+    deck = sapphire.Deck()
+    first = points(sapphire.deal(deck, order, players = (a, b)))
+    second = -points(sapphire.deal(deck, order, players = (b, a)))
+    return first, second
+
+def pairs(a, b, orders, processes = 1, chunksize = 16):
+    """ generate the result of each pair in order """
+    return parallel.results(play_pair, [(a, b, order) for order in orders],
+                            processes, chunksize)
+
+class Duel(object):
+    """ running totals of a head to head match, from a's side """
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.nets = []
+        self.singles = []
+
+    def add(self, result):
+        self.nets.append(sum(result))
+        self.singles += list(result)
+
+    def interval(self, values, z = 1.96):
+        """ mean and half width of the confidence interval """
+        n = len(values)
+        mean = float(sum(values)) / n if n else 0.0
+        if n < 2:
+            return mean, float('inf')
+        var = sum([(v - mean) ** 2 for v in values]) / (n - 1)
+        return mean, z * math.sqrt(var / n)
+
+    def report(self):
+        n = len(self.nets)
+        won = len([v for v in self.nets if v > 0])
+        lost = len([v for v in self.nets if v < 0])
+        mean, half = self.interval(self.nets)
+        single, single_half = self.interval(self.singles)
+        print '%s vs %s: %i pairs' % (self.a.name, self.b.name, n)
+        print 'pairs won: %6i lost: %6i tied: %6i' % (won, lost, n - won - lost)
+        print 'points per pair: %6.2f +- %.2f' % (mean, half)
+        print 'points per deal: %6.2f +- %.2f (%.2f +- %.2f unpaired)' % (
+            mean / 2, half / 2, single, single_half)
+
+def head_to_head(a, b, deals = 1000, seed = 0, processes = 1, progress = None):
+    """ play deals shuffles with a and b in each seat and return the Duel """
+    duel = Duel(a, b)
+    for r in pairs(a, b, shuffles(deals, seed), processes):
+        duel.add(r)
+        if progress:
+            progress(r)
+    return duel
+
+if __name__ == "__main__":
+    deals = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    a = STRATEGIES[sys.argv[2]] if len(sys.argv) > 2 else STRATEGIES['sampled']
+    b = STRATEGIES[sys.argv[3]] if len(sys.argv) > 3 else DEFAULT
+    head_to_head(a, b, deals).report()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+""" meld tables for the 8192 rank patterns of a suit
+
+    A suit of a hand is a 13 bit rank pattern (see masks.py), and the
+    runs in it, the best way to split it into runs and the deadwood that
+    leaves only depend on that pattern. The tables are built once and
+    kept in tables.cache next to this file, later imports just load them.
+
+    RUNS[p]      (start, length) of every run of 2 to 5 cards, by length
+                 then start, the order sapphire.runs has always used
+    RUN_MASKS[p] the same runs as 13 bit masks
+    BEST[p]      (deadwood, runs) for the best split into runs of 3 or
+                 more, runs as (start, length)
+    COVER[p]     most cards of the pattern that runs of 3 or more can hold
+    RUN_HITS[p]  for each rank, the runs of 3 through it whose other two
+                 cards are in p
+
+    All four suits share each table, so a table has one entry per pattern
+    where a table of hands would need one per renaming of the suits.
+"""
+
+import marshal
+import os
+import time
+from masks import *
+
+VERSION = 2
+CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables.cache')
+
+# deadwood points of each rank
+POINTS = [min(col + 1, 10) for col in range(13)]
+
+def _runs(p):
+    result = []
+    for n in range(2,6):
+        result += [(j, n) for j in iter_bits(run_starts(p, n))]
+    return tuple(result)
+
+def _best(p, table):
+    """ the lowest card is either deadwood or the start of a run, and the
+        patterns below p (as numbers) are already in table """
+    low = p & -p
+    j = low.bit_length() - 1
+    pts, rs = table[p ^ low]
+    best = (pts + POINTS[j], rs)
+    n = 1
+    while j + n < 13 and p >> (j + n) & 1:
+        n += 1
+        if n >= 3:
+            pts, rs = table[p & ~(((1 << n) - 1) << j)]
+            if pts < best[0]:
+                best = (pts, ((j, n),) + rs)
+    return best
+
+def _cover(p, table):
+    low = p & -p
+    j = low.bit_length() - 1
+    best = table[p ^ low]
+    n = 1
+    while j + n < 13 and p >> (j + n) & 1:
+        n += 1
+        if n >= 3:
+            best = max(best, n + table[p & ~(((1 << n) - 1) << j)])
+    return best
+
+def _hits(p):
+    result = []
+    for col in range(13):
+        q = p | 1 << col
+        result.append(len([s for s in range(max(col - 2, 0), min(col, 10) + 1)
+                           if q >> s & 7 == 7]))
+    return tuple(result)
+
+def build():
+    """ compute the tables, every pattern a card is removed from is
+        smaller so one pass in increasing order is enough """
+    size = 1 << 13
+    runs = [_runs(p) for p in range(size)]
+    best = [(0, ())]
+    cover = [0]
+    for p in range(1, size):
+        best.append(_best(p, best))
+        cover.append(_cover(p, cover))
+    hits = [_hits(p) for p in range(size)]
+    return {'version': VERSION, 'runs': runs, 'best': best, 'cover': cover,
+            'hits': hits}
+
+def load(path = CACHE):
+    """ the tables from path, building and saving them if need be """
+    try:
+        with open(path, 'rb') as f:
+            tables = marshal.load(f)
+        if tables.get('version') == VERSION:
+            return tables
+    except (IOError, EOFError, ValueError, TypeError):
+        pass
+    tables = build()
+    try:
+        with open(path, 'wb') as f:
+            marshal.dump(tables, f)
+    except IOError:
+        pass
+    return tables
+
+_tables = load()
+RUNS = _tables['runs']
+BEST = _tables['best']
+COVER = _tables['cover']
+RUN_HITS = _tables['hits']
+RUN_MASKS = [tuple([((1 << n) - 1) << j for j, n in rs]) for rs in RUNS]
+del _tables
+
+def _window_runs(p):
+    """ the runs of a pattern found the way sapphire.runs used to, with
+        sliding window sums over a list of 13 0s and 1s """
+    xs = [p >> i & 1 for i in range(13)]
+    result = []
+    for n in range(2,6):
+        run_length = [sum(xs[i:min(i + n, 13)]) for i in range(13)]
+        result += [(j, n) for j, x in enumerate(run_length) if x == n]
+    return tuple(result)
+
+def benchmark(patterns = 20000, seed = 0):
+    """ time run discovery by sliding windows, by bit operations and by
+        table lookup over random suit patterns """
+    import random
+    rng = random.Random(seed)
+    ps = [rng.getrandbits(13) & rng.getrandbits(13) for i in range(patterns)]
+    for name, func in [('window', _window_runs), ('bits', _runs),
+                       ('table', RUNS.__getitem__)]:
+        start = time.time()
+        for p in ps:
+            func(p)
+        elapsed = time.time() - start
+        print '%6s: %8.2f us per suit' % (name, elapsed / patterns * 1e6)
+
+if __name__ == "__main__":
+    benchmark()
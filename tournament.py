@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+""" play many matches of sapphire.py on a pool of processes
+
+    Every match gets its own seed, drawn up front from one master seed,
+    and reseeds random before it starts, so a match plays the same way
+    whichever worker runs it. Results are streamed back in match order,
+    which makes the totals of a parallel run identical to a serial one. """
+
+import math
+import random
+import sys
+import parallel
+import sapphire
+
+def match_seeds(matches, seed = 0):
+    """ independent seeds for each match derived from one master seed """
+    rng = random.Random(seed)
+    return [rng.getrandbits(63) for i in range(matches)]
+
+def play_seeded(seed):
+    """ (seed, sapphire's score, opponent's score, deals) of one match """
+    random.seed(seed)
+    s_score, o_score, deals = sapphire.match()
+    return seed, s_score, o_score, deals
+
+def results(seeds, processes = None, chunksize = 4):
+    """ generate the result of each match in order, processes = 1 plays
+        them in this process """
+    return parallel.results(play_seeded, seeds, processes, chunksize)
+
+def wilson(wins, n, z = 1.96):
+    """ confidence interval for a win rate """
+    if n == 0:
+        return 0.0, 1.0
+    p = float(wins) / n
+    centre = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return (centre - spread) / (1 + z * z / n), (centre + spread) / (1 + z * z / n)
+
+class Summary(object):
+    """ running totals of a tournament """
+    def __init__(self):
+        self.matches = 0
+        self.wins = 0
+        self.deals = 0
+        self.margins = []
+        self.scores = {}
+
+    def add(self, result):
+        seed, s_score, o_score, deals = result
+        self.matches += 1
+        self.deals += deals
+        if s_score > o_score:
+            self.wins += 1
+        self.margins.append(s_score - o_score)
+        for score in (s_score, o_score):
+            bucket = score // 25 * 25
+            self.scores[bucket] = self.scores.get(bucket, 0) + 1
+
+    def win_interval(self, z = 1.96):
+        return wilson(self.wins, self.matches, z)
+
+    def margin_interval(self, z = 1.96):
+        """ confidence interval for sapphire's mean winning margin """
+        n = len(self.margins)
+        if n < 2:
+            return float('-inf'), float('inf')
+        mean = float(sum(self.margins)) / n
+        var = sum([(m - mean) ** 2 for m in self.margins]) / (n - 1)
+        half = z * math.sqrt(var / n)
+        return mean - half, mean + half
+
+    def report(self):
+        low, high = self.win_interval()
+        mlow, mhigh = self.margin_interval()
+        print 'matches: %6i deals: %8i' % (self.matches, self.deals)
+        print 'sapphire wins: %6i opponent wins %6i' % (self.wins, self.matches - self.wins)
+        print 'win rate: %.3f  95%% ci: [%.3f, %.3f]' % (float(self.wins) / self.matches, low, high)
+        print 'mean margin 95%% ci: [%.1f, %.1f]' % (mlow, mhigh)
+        print 'final scores:'
+        for bucket in sorted(self.scores):
+            print '  %3i-%3i: %6i' % (bucket, bucket + 24, self.scores[bucket])
+
+def tournament(matches = 1000, seed = 0, processes = None, progress = None):
+    """ play matches and return their Summary, progress is called with
+        each match result as it arrives """
+    summary = Summary()
+    for r in results(match_seeds(matches, seed), processes):
+        summary.add(r)
+        if progress:
+            progress(r)
+    return summary
+
+if __name__ == "__main__":
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    tournament(matches, seed).report()